@@ -0,0 +1,229 @@
+"""
+Measures the overhead of easy-requests against a local stub server, so changes to Cache and Connection can be compared between releases.
+
+    python bin/benchmark.py --requests 500 --output results.json
+    python bin/benchmark.py --scenario cache_hit --scenario retry_storm
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import metadata
+from pathlib import Path
+from typing import Callable, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from easy_requests import Connection, Metrics, RetryPolicy
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET with `size` bytes after `latency` seconds.
+    With `error_rate` a share of the requests gets a 429 instead.
+    """
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with nagle every keep alive response would wait for a delayed ack
+    disable_nagle_algorithm = True
+    random = random.Random(0)
+    random_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        size = int(query.get("size", ["1024"])[0])
+        latency = float(query.get("latency", ["0"])[0])
+        error_rate = float(query.get("error_rate", ["0"])[0])
+
+        if latency > 0:
+            time.sleep(latency)
+
+        with self.random_lock:
+            rate_limited = self.random.random() < error_rate
+
+        if rate_limited:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        self.wfile.write(b"x" * size)
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_requests(connection: Connection, urls: List[str], workers: int) -> Dict[str, float]:
+    latencies: List[float] = []
+
+    def fetch(url: str):
+        started = time.perf_counter()
+        connection.get(url).content
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if workers <= 1:
+        for url in urls:
+            fetch(url)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(fetch, urls))
+    total = time.perf_counter() - started
+
+    return {
+        "requests": len(urls),
+        "seconds": total,
+        "requests_per_second": len(urls) / total if total > 0 else 0.0,
+        "p50_ms": get_percentile(latencies, 50) * 1000,
+        "p99_ms": get_percentile(latencies, 99) * 1000,
+    }
+
+
+def make_urls(base: str, name: str, count: int, **query) -> List[str]:
+    parameters = "&".join(f"{key}={value}" for key, value in query.items())
+    return [f"{base}/{name}/{i}?{parameters}" for i in range(count)]
+
+
+def bench_cold(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    connection = Connection(cache_enabled=False)
+    return run_requests(connection, make_urls(base, "cold", args.requests, size=args.size, latency=args.latency), args.workers)
+
+
+def bench_cold_cached(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    connection = Connection(cache_enabled=True, cache_directory=str(cache_directory / "cold_cached"))
+    return run_requests(connection, make_urls(base, "cold_cached", args.requests, size=args.size, latency=args.latency), args.workers)
+
+
+def bench_cold_write_behind(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    connection = Connection(cache_enabled=True, cache_directory=str(cache_directory / "cold_write_behind"), cache_write_behind=True)
+    result = run_requests(connection, make_urls(base, "cold_write_behind", args.requests, size=args.size, latency=args.latency), args.workers)
+    connection.cache.flush()
+    return result
+
+
+def bench_cache_hit(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    connection = Connection(cache_enabled=True, cache_directory=str(cache_directory / "cache_hit"))
+    urls = make_urls(base, "cache_hit", args.requests, size=args.size, latency=args.latency)
+    run_requests(connection, urls, args.workers)
+    return run_requests(connection, urls, args.workers)
+
+
+def bench_memory_hit(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    connection = Connection(cache_enabled=True, cache_directory=str(cache_directory / "memory_hit"), cache_memory_entries=args.requests)
+    urls = make_urls(base, "memory_hit", args.requests, size=args.size, latency=args.latency)
+    run_requests(connection, urls, args.workers)
+    return run_requests(connection, urls, args.workers)
+
+
+def bench_retry_storm(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    metrics = Metrics()
+    connection = Connection(
+        cache_enabled=False,
+        max_retries=None,
+        retry_policy=RetryPolicy(backoff_factor=0.001, backoff_max=0.01),
+        metrics=metrics,
+    )
+    urls = make_urls(base, "retry_storm", args.requests, size=args.size, latency=args.latency, error_rate=args.error_rate)
+    result = run_requests(connection, urls, args.workers)
+    result["retries"] = sum(host.get("retries", 0) for host in metrics.to_dict().values())
+    return result
+
+
+def bench_large_body(base: str, args: argparse.Namespace, cache_directory: Path) -> Dict[str, float]:
+    connection = Connection(cache_enabled=True, cache_directory=str(cache_directory / "large_body"))
+    urls = make_urls(base, "large_body", max(1, args.requests // 20), size=args.large_size, latency=args.latency)
+    result = {"cold": run_requests(connection, urls, args.workers)}
+    result["cache_hit"] = run_requests(connection, urls, args.workers)
+    return result
+
+
+SCENARIOS: Dict[str, Callable[[str, argparse.Namespace, Path], Dict]] = {
+    "cold": bench_cold,
+    "cold_cached": bench_cold_cached,
+    "cold_write_behind": bench_cold_write_behind,
+    "cache_hit": bench_cache_hit,
+    "memory_hit": bench_memory_hit,
+    "retry_storm": bench_retry_storm,
+    "large_body": bench_large_body,
+}
+
+
+def get_version() -> str:
+    try:
+        return metadata.version("easy-requests")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark easy-requests against a local stub server.")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Scenario to run, can be repeated (default: all).")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+    parser.add_argument("--workers", type=int, default=1, help="Threads sending requests concurrently.")
+    parser.add_argument("--size", type=int, default=1024, help="Body size in bytes.")
+    parser.add_argument("--large-size", type=int, default=16 * 1024 * 1024, help="Body size in bytes of the large_body scenario.")
+    parser.add_argument("--latency", type=float, default=0, help="Latency the stub server adds to every response in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.3, help="Share of requests answered with 429 in the retry_storm scenario.")
+    parser.add_argument("--output", type=Path, help="File to write the results to (default: stdout).")
+    args = parser.parse_args()
+
+    # the retry storm would log a warning for every retry
+    logging.getLogger("easy_requests").setLevel(logging.ERROR)
+
+    server = start_stub_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    cache_directory = Path(tempfile.mkdtemp(prefix="easy_requests_benchmark_"))
+
+    results = {
+        "version": get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenario or SCENARIOS:
+            results["scenarios"][name] = SCENARIOS[name](base, args, cache_directory)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_directory, ignore_errors=True)
+
+    output = json.dumps(results, indent=4)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Guards the startup time of easy-requests, fails if importing it pulls in heavy modules or takes too long.
+
+    python bin/check_import_time.py --max-ms 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# modules that must only be imported once they are actually needed
+HEAVY_MODULES = ("requests", "urllib3", "sqlite3", "httpx", "pickle", "inspect", "lzma", "zlib", "zstandard", "easy_requests.compression")
+
+# every snippet runs in a fresh interpreter and prints the heavy modules it imported
+SNIPPETS = {
+    "import easy_requests": "import easy_requests",
+    "from easy_requests import init_cache": "from easy_requests import init_cache",
+    "python -m easy_requests --help": "import easy_requests.__main__",
+}
+
+# modules loaded by the interpreter itself, e.g. by site hooks, aren't blamed on the package
+CHECK = """
+import sys
+before = set(sys.modules)
+{snippet}
+print(__import__("json").dumps([m for m in {heavy!r} if m in sys.modules and m not in before]))
+"""
+
+TIMING = """
+import time
+started = time.perf_counter()
+from easy_requests import init_cache
+print(time.perf_counter() - started)
+"""
+
+
+def get_import_ms(cache_directory: str) -> float:
+    """
+    Measures how long importing the package and its default cache takes in a fresh interpreter, with a configured cache directory.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", TIMING],
+        cwd=ROOT,
+        env={**os.environ, "EASY_REQUESTS_CACHE_DIR": cache_directory},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.splitlines()[-1]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of easy-requests.")
+    parser.add_argument("--max-ms", type=float, default=50, help="Maximum time importing init_cache may take in milliseconds.")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as temp:
+        cache_directory = str(Path(temp) / "cache")
+
+        for name, snippet in SNIPPETS.items():
+            result = subprocess.run(
+                [sys.executable, "-c", CHECK.format(snippet=snippet, heavy=HEAVY_MODULES)],
+                cwd=ROOT,
+                env={**os.environ, "EASY_REQUESTS_CACHE_DIR": cache_directory},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            imported = json.loads(result.stdout.splitlines()[-1])
+            if imported:
+                failed = True
+                print(f"FAIL {name} imports {', '.join(imported)}")
+            else:
+                print(f"ok   {name}")
+
+        if Path(cache_directory).exists():
+            failed = True
+            print("FAIL importing created the cache directory")
+
+        # the first run warms up the bytecode cache
+        get_import_ms(cache_directory)
+        import_ms = min(get_import_ms(cache_directory) for _ in range(5))
+        if import_ms > args.max_ms:
+            failed = True
+            print(f"FAIL import easy_requests took {import_ms:.1f}ms, allowed are {args.max_ms}ms")
+        else:
+            print(f"ok   import easy_requests took {import_ms:.1f}ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,58 @@
-from .cache import init_cache
-from .connections import Connection, SilentConnection
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .cache import init_cache
+    from .connections import Connection, SilentConnection
+    from .async_connections import AsyncConnection, SilentAsyncConnection
+    from .rate_limit import RateLimiter, HostRateLimiter, AdaptiveRateLimiter, TokenBucket
+    from .retry import RetryPolicy
+    from .metrics import Metrics
+    from .scheduler import Scheduler
 
 
 __name__ = "easy_requests"
 __all__ = [
     "init_cache",
-    "Connection", 
+    "Connection",
     "SilentConnection",
+    "AsyncConnection",
+    "SilentAsyncConnection",
+    "RateLimiter",
+    "HostRateLimiter",
+    "AdaptiveRateLimiter",
+    "TokenBucket",
+    "RetryPolicy",
+    "Metrics",
+    "Scheduler",
 ]
+
+# the submodules pull in requests, sqlite3 and httpx, so they are only imported once something of them is used
+_lazy_imports = {
+    "init_cache": ".cache",
+    "Connection": ".connections",
+    "SilentConnection": ".connections",
+    "AsyncConnection": ".async_connections",
+    "SilentAsyncConnection": ".async_connections",
+    "RateLimiter": ".rate_limit",
+    "HostRateLimiter": ".rate_limit",
+    "AdaptiveRateLimiter": ".rate_limit",
+    "TokenBucket": ".rate_limit",
+    "RetryPolicy": ".retry",
+    "Metrics": ".metrics",
+    "Scheduler": ".scheduler",
+}
+
+
+def __getattr__(name: str):
+    module = _lazy_imports.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(module, __package__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,16 +1,81 @@
-from pathlib import Path
 import argparse
+import fnmatch
 import logging
+import os
+import sys
+from typing import List
 
 
 def get_name(url: str) -> str:
     return url.split("/")[-1].split("?")[0]
 
 
+def configure_logging(verbose: bool):
+    if verbose:
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+        logging.debug("Debug logging enabled")
+    else:
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s'
+        )
+
+
+def cache_cli(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="python -m easy_requests cache",
+        description="Export the cache into an archive or import one, to pre-warm the cache of another machine.",
+    )
+    parser.add_argument(
+        "--cache-dir", "-c",
+        default=os.getenv("EASY_REQUESTS_CACHE_DIR"),
+        help="cache directory (defaults to EASY_REQUESTS_CACHE_DIR)",
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Sets the logging level to debug."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="pack the cache into an archive, gzip compressed if it ends with .gz")
+    export_parser.add_argument("archive", help="archive to write")
+    export_parser.add_argument(
+        "--match", "-m",
+        help="only export urls matching this glob pattern, e.g. 'https://example.com/*'",
+    )
+
+    import_parser = subparsers.add_parser("import", help="unpack an archive into the cache, keeping the entry that expires later")
+    import_parser.add_argument("archive", help="archive to read")
+
+    args = parser.parse_args(argv)
+    configure_logging(args.verbose)
+
+    if args.cache_dir is None:
+        parser.error("no cache directory, pass --cache-dir or set EASY_REQUESTS_CACHE_DIR")
+
+    from .cache import Cache
+    cache = Cache.get_instance(args.cache_dir)
+
+    if args.command == "export":
+        pattern = args.match
+        cache.export(args.archive, filter=None if pattern is None else lambda entry: fnmatch.fnmatchcase(entry["url"], pattern))
+    else:
+        cache.import_(args.archive)
+
+
 def cli():
+    # the cache has its own sub commands, everything else is a url to download
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        return cache_cli(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description="A Python library for simplified HTTP requests, featuring rate limiting, browser-like headers, and automatic retries. Built on the official `requests` library for reliability.",
-        formatter_class=argparse.RawTextHelpFormatter
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="To export or import the cache see `python -m easy_requests cache --help`.",
     )
 
     parser.add_argument('url', help='url to download')
@@ -22,6 +87,13 @@ def cli():
         help="tells the program where to download to",
     )
 
+    parser.add_argument(
+        "--segments", "-s",
+        type=int,
+        default=1,
+        help="downloads this many byte ranges at the same time if the server supports it,\nrunning it again after a failure only downloads the missing ones",
+    )
+
     parser.add_argument(
         "--verbose", "-v",
         action="store_true",
@@ -31,17 +103,7 @@ def cli():
     args = parser.parse_args()
 
     # Configure logging based on the debug flag
-    if args.verbose:
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
-        logging.debug("Debug logging enabled")
-    else:
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+    configure_logging(args.verbose)
 
     logger = logging.getLogger("easy_requests")
 
@@ -55,9 +117,7 @@ def cli():
     connection = Connection()
     connection.generate_headers(get_referer_from=url)
     
-    res = connection.get(url)
-    with Path(out_file).open("wb") as f:
-        f.write(res.content)
+    connection.download(url, out_file, segments=args.segments)
 
 
 
@@ -0,0 +1,511 @@
+from __future__ import annotations
+from typing import AsyncIterator, Iterable, Optional, Set, Tuple
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from datetime import timedelta
+import asyncio
+import copy
+import io
+import logging
+import json
+import time
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from . import cache as c
+from .connections import BaseConnection
+from .rate_limit import RateLimiter
+from .metrics import Metrics
+from .retry import RetryPolicy
+from .single_flight import AsyncSingleFlight
+
+
+logger = logging.getLogger("easy_requests")
+
+
+def _to_requests_response(response: httpx.Response, prepared: requests.PreparedRequest) -> requests.Response:
+    result = requests.Response()
+    result.status_code = response.status_code
+    result.reason = response.reason_phrase
+    result.url = str(response.url)
+    result.headers = CaseInsensitiveDict(response.headers.multi_items())
+    result.encoding = get_encoding_from_headers(result.headers)
+    result.elapsed = response.elapsed
+    result.request = prepared
+    result._content = response.content
+    # the body was read already, like a consumed requests.Response, so iter_content and close work on it
+    result._content_consumed = True
+    result.raw = io.BytesIO(response.content)
+    return result
+
+
+class AsyncConnection(BaseConnection):
+    """Initialize an asyncio based Connection with request and caching configuration.
+    It has the same surface as Connection, but the request functions are coroutines.
+    Requests are sent with httpx, responses are returned as `requests.Response` so they work with the cache and existing code.
+
+    Args:
+        client: Existing httpx.AsyncClient to send the requests with (creates new if None), redirects are followed like with requests.
+        session: requests Session that holds the default headers and cookies (creates new if None).
+        headers: Default headers to add to all requests.
+
+        request_delay: Base delay between requests to the same host in seconds.
+        max_retries: Maximum number of retry attempts for failed requests.
+        additional_delay_per_try: Delay before the first retry, it grows exponentially with every further retry.
+        retry_policy: Decides if and after how long failed requests are retried (defaults to one built from additional_delay_per_try).
+        rate_limiter: Decides how long to wait before each request (defaults to a per host limiter using request_delay).
+        adaptive_rate_limit: Learn the rate every host allows from rate limited responses, starting at request_delay (ignored if rate_limiter is passed).
+        metrics: Collects timings and counters of the requests and calls hooks for them (nothing is measured if None).
+        pool_maxsize: Number of keep alive connections the created httpx client pools (ignored if client is passed).
+
+        error_status_codes: HTTP status codes that trigger immediate failure.
+        warning_status_codes: HTTP status code that trigger immediate failure but won't raise an error
+        rate_limit_status_codes: HTTP status codes that trigger retries.
+
+        cache_enabled: Whether response caching is enabled.
+        cache_directory: Directory path for cached responses.
+        cache_expires_after: Duration before cached responses expire.
+        cache_memory_entries: Number of responses kept in the in memory cache tier, 0 disables it.
+        cache_memory_bytes: Maximum total body size of the in memory cache tier.
+        cache_respect_cache_control: Use max-age and stale-while-revalidate of responses instead of cache_expires_after.
+        cache_max_size: Bytes the cache may take up on disk before least recently used entries are evicted, 0 means unlimited.
+        cache_compression: Codec for cached bodies: none, zlib, lzma, zstd (if installed) or auto.
+        cache_compression_min_size: Bodies smaller than this are stored uncompressed.
+        cache_vary_headers: Request headers that are part of the cache key.
+        cache_write_behind: Write responses to the cache in a background thread, call `connection.cache.flush()` to wait for them.
+        cache_error_expires_after: Duration error responses are cached for, they still raise when served from the cache (0 doesn't cache them).
+        cache_stale_if_error: Duration expired responses are kept and served instead of raising when the server fails.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+
+        session: Optional[requests.Session] = None,
+        headers: Optional[dict] = None,
+
+        request_delay: float = 0,
+        max_retries: Optional[int] = 5,
+        additional_delay_per_try: float = 1,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        adaptive_rate_limit: bool = False,
+        metrics: Optional[Metrics] = None,
+
+        pool_maxsize: Optional[int] = None,
+
+        error_status_codes: Optional[Set[int]] = None,
+        warning_status_codes: Optional[Set[int]] = None,
+        rate_limit_status_codes: Optional[Set[int]] = None,
+
+        cache_enabled: Optional[bool] = None,
+        cache_directory: Optional[str] = None,
+        cache_expires_after: Optional[timedelta] = None,
+        cache_memory_entries: Optional[int] = None,
+        cache_memory_bytes: Optional[int] = None,
+        cache_respect_cache_control: Optional[bool] = None,
+        cache_max_size: Optional[int] = None,
+        cache_compression: Optional[str] = None,
+        cache_compression_min_size: Optional[int] = None,
+        cache_vary_headers: Optional[Tuple[str, ...]] = None,
+        cache_write_behind: Optional[bool] = None,
+        cache_error_expires_after: Optional[timedelta] = None,
+        cache_stale_if_error: Optional[timedelta] = None,
+    ) -> None:
+        if httpx is None:
+            raise ImportError("AsyncConnection needs httpx, install it with `pip install easy-requests[async]`")
+
+        new_kwargs = locals()
+        new_kwargs.pop("self")
+        new_kwargs.pop("client")
+        new_kwargs.pop("pool_maxsize")
+        new_kwargs.pop("__class__", None)
+        super().__init__(**new_kwargs)
+
+        self._background_tasks: Set[asyncio.Task] = set()
+        self.single_flight = AsyncSingleFlight()
+
+        # requests doesn't set a timeout by default either, but follows redirects unlike httpx
+        self.client = client if client is not None else httpx.AsyncClient(
+            timeout=None,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100 if pool_maxsize is None else pool_maxsize),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self) -> AsyncConnection:
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def _send_request(self, request: requests.Request, cache: Optional[c.Cache] = None, **kwargs) -> requests.Response:
+        url = request.url
+        if url is None:
+            raise ValueError("can't send a request without url")
+
+        cache = self.cache.fork(**kwargs) if cache is None else cache
+        is_streamed = self._has_streamed_body(request)
+        if is_streamed and cache.is_enabled:
+            # the body isn't part of the cache key, so the response can't be cached
+            cache = cache.fork(cache_enabled=False)
+        url_hash = self.get_request_hash(request, cache=cache, cache_identifier=kwargs.get("cache_identifier", ""))
+
+        if kwargs.get("referer") is not None:
+            request.headers["Referer"] = kwargs.get("referer")
+
+        # identical requests that are in flight at the same time are only sent once, the others wait for the result
+        if request.method in self.coalesce_methods and not is_streamed and not kwargs.get("stream") and not kwargs.get("coalesced"):
+            response, is_leader = await self.single_flight.do(
+                (request.method, url_hash),
+                lambda: self._send_request(request, cache=cache, coalesced=True, **kwargs),
+            )
+            if is_leader or response is None:
+                return response
+            if cache.is_enabled and await asyncio.to_thread(cache.has_cache, url_hash):
+                return await asyncio.to_thread(self._get_cached, cache, url_hash)
+            return copy.copy(response)
+
+        max_retries = kwargs.get("max_retries")
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        if not logger.isEnabledFor(logging.DEBUG):
+            logger.info("%s %s", request.method, url)
+
+        logger.debug(
+            (
+                "%s\n"
+                "\tmethod        = %s\n"
+                "\turl           = %s\n"
+                "\tcache_enabled = %s\n"
+                "\tmax_retries   = %s\n"
+            ),
+            url_hash,
+            request.method,
+            url,
+            cache.is_enabled,
+            max_retries,
+        )
+
+        # the cache does blocking file and sqlite io, so it runs in a worker thread
+        metrics = self.metrics
+        if metrics is not None:
+            lookup_started = time.perf_counter()
+
+        is_cached = cache.is_enabled and (
+            await asyncio.to_thread(cache.has_cache, url_hash) 
+            or await asyncio.to_thread(self._adopt_legacy_entry, request, cache, url_hash, kwargs.get("cache_identifier", ""))
+        )
+        if metrics is not None and cache.is_enabled:
+            metrics.observe("cache_lookup", url, time.perf_counter() - lookup_started)
+            metrics.count("cache_hits" if is_cached else "cache_misses", url)
+        if is_cached:
+            return await asyncio.to_thread(self._get_cached, cache, url_hash)
+
+        # an expired entry can be revalidated with a conditional request instead of downloading it again
+        validators, serve_stale = await asyncio.to_thread(cache.get_revalidation, url_hash) if cache.is_enabled else ({}, False)
+        if serve_stale and not kwargs.get("revalidating"):
+            logger.info("%s - serving stale cache while revalidating", url_hash)
+            self._revalidate_in_background(request, cache, url_hash, **kwargs)
+            return await asyncio.to_thread(cache.get_cache, url_hash)
+        if validators:
+            request.headers = {**request.headers, **validators}
+
+        # all stuff that can be done before sending the request should be done here to minimize the possible time waiting
+        prepared = self.session.prepare_request(request)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("headers for %s\n%s", url_hash, json.dumps(dict(prepared.headers), indent=4))
+
+        started = time.monotonic()
+        attempt = 0
+        retry_delay = 0.0
+        while True:
+            if retry_delay > 0:
+                logger.debug("waiting for %.3f seconds before retry %s/%s", retry_delay, attempt, max_retries)
+                await asyncio.sleep(retry_delay)
+
+            waited = await self.rate_limiter.acquire_async(url)
+            if metrics is not None:
+                metrics.observe("rate_limit_wait", url, waited)
+                metrics.count("requests", url)
+                request_started = time.perf_counter()
+
+            try:
+                try:
+                    response = _to_requests_response(await self.client.request(
+                        prepared.method or "GET",
+                        prepared.url or url,
+                        headers=dict(prepared.headers),
+                        content=prepared.body,
+                        # also for clients that were passed in, so redirects are never cached
+                        follow_redirects=True,
+                    ), prepared)
+                except httpx.TimeoutException as e:
+                    raise requests.Timeout(e, request=prepared) from e
+                except httpx.TransportError as e:
+                    raise requests.ConnectionError(e, request=prepared) from e
+            except self.retry_policy.retry_exceptions as e:
+                if metrics is not None:
+                    metrics.count("errors", url)
+                retry_delay = self.retry_policy.get_delay(attempt)
+                if not self.retry_policy.should_retry(attempt, max_retries, time.monotonic() - started, retry_delay):
+                    return await asyncio.to_thread(self._handle_failure, e, cache, url_hash)
+                logger.warning("%s failed (%s), retrying", url, e)
+                if metrics is not None:
+                    metrics.count("retries", url)
+                attempt += 1
+                continue
+
+            self.rate_limiter.on_response(url, response.status_code in self.rate_limit_status_codes)
+            if metrics is not None:
+                metrics.observe("request", url, time.perf_counter() - request_started)
+                if response.status_code in self.rate_limit_status_codes:
+                    metrics.count("rate_limited", url)
+
+            if response.status_code == 304 and validators:
+                return await asyncio.to_thread(cache.refresh_cache, url_hash, response)
+
+            if response.status_code in self.warning_status_codes:
+                logger.warning("server returned error status code %s %s", response.status_code, response.reason)
+                if cache.is_enabled and cache.error_expires_after > timedelta(0):
+                    await asyncio.to_thread(cache.write_cache, url_hash, response)
+                return response
+
+            # retry status codes are retried even if they are error status codes as well, like 502 and 503 by default
+            should_retry = response.status_code in self.retry_policy.retry_status_codes
+            try:
+                is_valid = should_retry or self.validate_response(response)
+            except requests.HTTPError as e:
+                return await asyncio.to_thread(self._handle_failure, e, cache, url_hash)
+
+            if should_retry or not is_valid:
+                retry_delay = self.retry_policy.get_delay(attempt, response)
+                if not self.retry_policy.should_retry(attempt, max_retries, time.monotonic() - started, retry_delay):
+                    return await asyncio.to_thread(self._handle_failure, requests.HTTPError(
+                        f"Max retries exceeded, server returned status code {response.status_code}: {response.reason}",
+                        response=response
+                    ), cache, url_hash)
+                logger.warning("server returned status code %s %s, retrying", response.status_code, response.reason)
+                if metrics is not None:
+                    metrics.count("retries", url)
+                attempt += 1
+                continue
+
+            break
+
+        if cache.is_enabled:
+            if metrics is not None:
+                write_started = time.perf_counter()
+            await asyncio.to_thread(cache.write_cache, url_hash, response)
+            if metrics is not None:
+                metrics.observe("cache_write", url, time.perf_counter() - write_started)
+
+        return response
+
+    def _revalidate_in_background(self, request: requests.Request, cache: c.Cache, url_hash: str, **kwargs):
+        if url_hash in self._revalidating:
+            return
+        self._revalidating.add(url_hash)
+
+        async def revalidate():
+            try:
+                await self._send_request(request, cache=cache, revalidating=True, **kwargs)
+            except requests.exceptions.RequestException as e:
+                logger.warning("revalidating %s failed: %s", request.url, e)
+            finally:
+                self._revalidating.discard(url_hash)
+
+        # the event loop only keeps weak references to tasks
+        task = asyncio.ensure_future(revalidate())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def send_request(
+        self,
+        request: requests.Request,
+
+        max_retries: Optional[int] = None,
+        cache_identifier: str = "",
+        referer: Optional[str] = None,
+
+        cache_enabled: Optional[bool] = None,
+        cache_directory: Optional[str] = None,
+        cache_expires_after: Optional[timedelta] = None,
+        **kwargs,
+    ):
+        """Send a prepared Request object with retry and caching support.
+
+        Args:
+            request: Prepared requests.Request to send.
+            max_retries: Override default max retry attempts.
+            cache_identifier: Additional key for cache differentiation.
+            referer: Referer header to set for this request.
+            cache_enabled: Temporarily enable/disable caching.
+            cache_directory: Alternate cache location for this request.
+            cache_expires_after: Custom cache expiration for this request.
+        Returns:
+            requests.Response: The server's response.
+        """
+
+        new_kwargs = locals()
+        new_kwargs.pop("self")
+        new_kwargs.update(new_kwargs.pop("kwargs"))
+
+        return await self._send_request(**new_kwargs)
+
+    async def get(
+        self,
+        url: str,
+        headers: Optional[dict] = None,
+        request_kwargs: Optional[dict] = None,
+
+        max_retries: Optional[int] = None,
+        cache_identifier: str = "",
+        referer: Optional[str] = None,
+
+        cache_enabled: Optional[bool] = None,
+        cache_directory: Optional[str] = None,
+        cache_expires_after: Optional[timedelta] = None,
+        **kwargs,
+    ):
+        """Send a GET request with retry and caching support.
+
+        Args:
+            url: Target URL for the request.
+            headers: Additional headers for this request.
+            request_kwargs: Additional arguments for Request constructor.
+            max_retries: Override default max retry attempts.
+            cache_identifier: Additional key for cache differentiation.
+            referer: Referer header to set for this request.
+            cache_enabled: Temporarily enable/disable caching.
+            cache_directory: Alternate cache location for this request.
+            cache_expires_after: Custom cache expiration for this request.
+        Returns:
+            requests.Response: The server's response.
+        """
+
+        new_kwargs = locals()
+        new_kwargs.pop("self")
+        new_kwargs.update(new_kwargs.pop("kwargs"))
+
+        return await self._send_request(requests.Request(
+            'GET',
+            url=url,
+            headers=headers,
+            **({} if request_kwargs is None else request_kwargs)
+        ), **new_kwargs)
+
+    async def post(
+        self,
+        url: str,
+        data: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        request_kwargs: Optional[dict] = None,
+
+        max_retries: Optional[int] = None,
+        cache_identifier: str = "",
+        referer: Optional[str] = None,
+
+        cache_enabled: Optional[bool] = None,
+        cache_directory: Optional[str] = None,
+        cache_expires_after: Optional[timedelta] = None,
+        **kwargs,
+    ):
+        """Send a POST request with retry and caching support.
+
+        Args:
+            url: Target URL for the request.
+            data: Data to send in request body.
+            headers: Additional headers for this request.
+            request_kwargs: Additional arguments for Request constructor.
+            max_retries: Override default max retry attempts.
+            cache_identifier: Additional key for cache differentiation.
+            referer: Referer header to set for this request.
+            cache_enabled: Temporarily enable/disable caching.
+            cache_directory: Alternate cache location for this request.
+            cache_expires_after: Custom cache expiration for this request.
+        Returns:
+            requests.Response: The server's response.
+        """
+
+        new_kwargs = locals()
+        new_kwargs.pop("self")
+        new_kwargs.update(new_kwargs.pop("kwargs"))
+
+        return await self._send_request(requests.Request(
+            'POST',
+            url=url,
+            headers=headers,
+            data=data,
+            **({} if request_kwargs is None else request_kwargs),
+        ), **new_kwargs)
+
+    async def get_many(
+        self,
+        urls: Iterable[str],
+        max_workers: int = 100,
+        ordered: bool = False,
+        **kwargs,
+    ) -> AsyncIterator[Tuple[str, Optional[requests.Response]]]:
+        """Send GET requests for many urls concurrently.
+
+        Args:
+            urls: Target URLs for the requests.
+            max_workers: Number of requests that are in flight at the same time.
+            ordered: Yield the results in the order of `urls` instead of the order they complete.
+            **kwargs: Arguments passed to every `get` call.
+        Yields:
+            Tuple[str, requests.Response]: The url and the server's response.
+        """
+
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(url: str) -> Tuple[str, Optional[requests.Response]]:
+            async with semaphore:
+                return url, await self.get(url, **kwargs)
+
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+        try:
+            for task in (tasks if ordered else asyncio.as_completed(tasks)):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class SilentAsyncConnection(AsyncConnection):
+    """Initialize an asyncio based Connection with request and caching configuration.
+    If a request was not successful it returns None instead of raising and exception
+
+    Args:
+        client: Existing httpx.AsyncClient to send the requests with (creates new if None), redirects are followed like with requests.
+        session: requests Session that holds the default headers and cookies (creates new if None).
+        headers: Default headers to add to all requests.
+        request_delay: Base delay between requests to the same host in seconds.
+        additional_delay_per_try: Delay before the first retry, it grows exponentially with every further retry.
+        retry_policy: Decides if and after how long failed requests are retried (defaults to one built from additional_delay_per_try).
+        rate_limiter: Decides how long to wait before each request (defaults to a per host limiter using request_delay).
+        adaptive_rate_limit: Learn the rate every host allows from rate limited responses, starting at request_delay (ignored if rate_limiter is passed).
+        metrics: Collects timings and counters of the requests and calls hooks for them (nothing is measured if None).
+        pool_maxsize: Number of keep alive connections the created httpx client pools (ignored if client is passed).
+        error_status_codes: HTTP status codes that trigger immediate failure.
+        rate_limit_status_codes: HTTP status codes that trigger retries.
+        max_retries: Maximum number of retry attempts for failed requests.
+        cache_enabled: Whether response caching is enabled.
+        cache_directory: Directory path for cached responses.
+        cache_expires_after: Duration before cached responses expire.
+    """
+
+    async def _send_request(self, *args, **kwargs) -> Optional[requests.Response]:
+        try:
+            return await super()._send_request(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            logger.warning(e)
+            return None
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, List, Optional
+
+
+logger = logging.getLogger("easy_requests")
+
+
+class BackgroundWriter:
+    """Hands queued items to `write_batch` in a background thread, everything queued since the last batch is written at once.
+
+    Args:
+        write_batch: Writes a list of items, it only ever runs in the background thread.
+        max_queue: Maximum number of waiting items, `put` blocks once it is reached.
+        max_batch: Maximum number of items written in one batch.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Any]], None], max_queue: int = 1024, max_batch: int = 256):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def put(self, item: Any):
+        """
+        Queues an item, blocks while the queue is full so producers can't outrun the writer.
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="easy_requests-writer", daemon=True)
+                    self._thread.start()
+
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.write_batch(batch)
+            except Exception:
+                logger.exception("writing %s queued items failed", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until every item queued so far is written.
+        """
+        if self._thread is not None:
+            self._queue.join()
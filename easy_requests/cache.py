@@ -1,51 +1,349 @@
 from __future__ import annotations
 
 import logging
-from typing import Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
 from codecs import encode
-from hashlib import sha1
+from hashlib import blake2b, sha1
 from pathlib import Path
-import requests
-import pickle
-import sqlite3
 from datetime import datetime, timedelta
+import atexit
+import copy
 import os
-from datetime import timedelta
+import re
+import json
+import threading
+import weakref
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .background_writer import BackgroundWriter
+from .memory_cache import MemoryCache
+
+# requests, sqlite3 and the compression codecs are imported on first use, so importing the package stays fast for short lived processes
+if TYPE_CHECKING:
+    import sqlite3
+    import requests
 
 
 logger = logging.getLogger("easy_requests")
 
 
+DEFAULT_MEMORY_ENTRIES = int(os.getenv("EASY_REQUESTS_CACHE_MEMORY_ENTRIES", 0))
+DEFAULT_MEMORY_BYTES = int(os.getenv("EASY_REQUESTS_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+DEFAULT_COMPRESSION = os.getenv("EASY_REQUESTS_CACHE_COMPRESSION", "none")
+DEFAULT_COMPRESSION_MIN_SIZE = int(os.getenv("EASY_REQUESTS_CACHE_COMPRESSION_MIN_SIZE", 1024))
+# 0 means the size of the cache isn't limited
+DEFAULT_MAX_SIZE = int(os.getenv("EASY_REQUESTS_CACHE_MAX_SIZE", 0))
+
+# what url hashes look like, both the current blake2b and the legacy sha1 ones
+_HASH_PATTERN = re.compile(r"[0-9a-f]+")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalizes the parts of the url that don't change the response, e.g. the order of query parameters.
+    """
+    parsed = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunsplit((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or "/", query, ""))
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """
+    Parses a Cache-Control header into its directives, e.g. `max-age=60, no-store` -> `{"max-age": "60", "no-store": None}`
+    """
+    directives: Dict[str, Optional[str]] = {}
+    for directive in value.split(","):
+        name, _, argument = directive.partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = argument.strip().strip('"') if argument else None
+    return directives
+
+
+class _ThreadConnection:
+    """
+    Holds the sqlite connection of one thread in its thread local storage, a finalizer closes the connection once the holder is dropped.
+    """
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _close_connection(connections: Set[sqlite3.Connection], lock: threading.Lock, conn: sqlite3.Connection):
+    with lock:
+        connections.discard(conn)
+    conn.close()
+
+
 class Cache:
+    # every configuration is only created once per process, see Cache.get_instance
+    _instances: Dict[tuple, Cache] = {}
+    _instances_lock = threading.Lock()
+    # directories which already have the mkdir and schema setup done
+    _initialized_directories: Set[Path] = set()
+    _initialize_lock = threading.Lock()
+    # caches of the same directory with the same limits share their memory tier
+    _memory_caches: Dict[Tuple[Path, int, int], MemoryCache] = {}
+    # last_access is only updated on a hit if it is older than this, eviction doesn't need it more precise
+    last_access_resolution = timedelta(minutes=1)
+
+    # columns that were added to url_cache later on, they are added to existing databases when opened
+    _added_columns: Dict[str, str] = {
+        "etag": "TEXT",
+        "last_modified": "TEXT",
+        "stale_until": "TIMESTAMP",
+        "stale_if_error_until": "TIMESTAMP",
+        "size": "INTEGER",
+        "last_access": "TIMESTAMP",
+    }
+
     def __init__(
         self, 
         directory: Optional[str], 
-        expires_after: timedelta = timedelta(days=float(os.getenv("EASY_REQUESTS_CACHE_EXPIRES", 1)))
+        expires_after: timedelta = timedelta(days=float(os.getenv("EASY_REQUESTS_CACHE_EXPIRES", 1))),
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        memory_bytes: int = DEFAULT_MEMORY_BYTES,
+        respect_cache_control: bool = False,
+        max_size: int = DEFAULT_MAX_SIZE,
+        compression: str = DEFAULT_COMPRESSION,
+        compression_min_size: int = DEFAULT_COMPRESSION_MIN_SIZE,
+        vary_headers: Tuple[str, ...] = (),
+        write_behind: bool = False,
+        error_expires_after: timedelta = timedelta(0),
+        stale_if_error: timedelta = timedelta(0),
     ):
         logger.info("initializing cache at %s, values expire after %s", directory, expires_after)
         
         self.expires_after = expires_after
         self._directory: Optional[Path] = None if directory is None or directory.strip() == "" else Path(directory)
 
-        # initialize database if exist
-        if self.is_enabled:
-            self.directory.mkdir(exist_ok=True)
-            with sqlite3.connect(self.database_file) as conn:
+        # use max-age and stale-while-revalidate of the response instead of expires_after if present
+        self.respect_cache_control = respect_cache_control
+
+        # error responses are cached for this long, 0 means they aren't cached
+        self.error_expires_after = error_expires_after
+        # expired entries are kept this long after expiring, to be served if the server fails
+        self.stale_if_error = stale_if_error
+
+        # bytes the cache files may take up, least recently used entries are evicted above it
+        self.max_size = max_size
+
+        # request headers that are part of the cache key, like the Vary header of a response
+        self.vary_headers = tuple(sorted(header.lower() for header in vary_headers))
+
+        # codec for new entries, every entry records its own codec so existing entries stay readable
+        from .compression import get_codec
+        get_codec(compression)
+        self.compression = compression
+        self.compression_min_size = compression_min_size
+
+        # writes happen in a background thread that commits the index in batches, see write_cache
+        self.write_behind = write_behind
+        self._writer: Optional[BackgroundWriter] = None
+        # responses that are queued but not written yet, so lookups don't miss them in the meantime
+        self._pending: Dict[str, requests.Response] = {}
+        self._pending_lock = threading.Lock()
+
+        self.memory_entries = memory_entries
+        self.memory_bytes = memory_bytes
+        self.memory: Optional[MemoryCache] = None
+        if self.is_enabled and memory_entries > 0:
+            memory_key = (self.directory.absolute(), memory_entries, memory_bytes)
+            self.memory = self._memory_caches.setdefault(memory_key, MemoryCache(max_entries=memory_entries, max_bytes=memory_bytes))
+
+        # lookups that had to go to the disk tier
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+        # a sqlite connection must not be used by several threads at once, so every thread gets its own long lived one
+        # it is closed once the thread ends, so short lived thread pools don't leak connections
+        self._local = threading.local()
+        self._connections: Set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+
+    def _initialize(self, conn: sqlite3.Connection):
+        """
+        Creates and migrates the schema of the database.
+        This happens with the first cache operation instead of in `__init__`, so creating caches stays cheap.
+        """
+        import sqlite3
+
+        directory = self.directory.absolute()
+        if directory in self._initialized_directories:
+            return
+
+        with self._initialize_lock:
+            if directory in self._initialized_directories:
+                return
+
+            with conn:
                 conn.execute("""
                 CREATE TABLE IF NOT EXISTS url_cache (
                     url_hash TEXT PRIMARY KEY,
                     expires_at TIMESTAMP
                 )
                 """)
-                conn.commit()
+
+                self._migrate_layout(conn)
+
+                existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(url_cache)")}
+                for column, column_type in self._added_columns.items():
+                    if column in existing_columns:
+                        continue
+                    try:
+                        conn.execute(f"ALTER TABLE url_cache ADD COLUMN {column} {column_type}")
+                    except sqlite3.OperationalError:
+                        # another process added it in the meantime
+                        continue
+
+                    if column == "size":
+                        self._backfill_sizes(conn)
+
+                conn.execute("CREATE INDEX IF NOT EXISTS url_cache_last_access ON url_cache (last_access)")
+
+                # totals kept up to date by triggers, so the size of the cache never has to be summed up
+                conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    entries INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                )
+                """)
+                conn.execute("""
+                INSERT OR IGNORE INTO cache_totals (id, entries, bytes) 
+                SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM url_cache
+                """)
+                conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS url_cache_insert AFTER INSERT ON url_cache BEGIN
+                    UPDATE cache_totals SET entries = entries + 1, bytes = bytes + COALESCE(NEW.size, 0);
+                END
+                """)
+                conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS url_cache_delete AFTER DELETE ON url_cache BEGIN
+                    UPDATE cache_totals SET entries = entries - 1, bytes = bytes - COALESCE(OLD.size, 0);
+                END
+                """)
+                conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS url_cache_update_size AFTER UPDATE OF size ON url_cache BEGIN
+                    UPDATE cache_totals SET bytes = bytes + COALESCE(NEW.size, 0) - COALESCE(OLD.size, 0);
+                END
+                """)
+            self._initialized_directories.add(directory)
+
+    # version of the directory layout, stored as the user_version of the database
+    # 0: every cache file directly in the cache directory
+    # 1: cache files sharded into two levels of sub directories, see get_url_file
+    layout_version = 1
+
+    def _migrate_layout(self, conn: sqlite3.Connection):
+        """
+        Moves the cache files of older layouts to where get_url_file expects them.
+        This only happens once per cache directory.
+        """
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.layout_version:
+            return
+
+        logger.info("migrating cache at %s to the sharded layout", self.directory)
+        for cache_file in self.directory.glob("*.request"):
+            target = self.get_url_file(cache_file.stem)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.replace(cache_file, target)
+            except FileNotFoundError:
+                # another process moved it already
+                continue
+
+        conn.execute(f"PRAGMA user_version = {self.layout_version}")
+
+    def _backfill_sizes(self, conn: sqlite3.Connection):
+        """
+        Fills the size column of entries written before sizes were recorded.
+        """
+        sizes = []
+        for (url_hash,) in conn.execute("SELECT url_hash FROM url_cache WHERE size IS NULL").fetchall():
+            try:
+                sizes.append((self.get_url_file(url_hash).stat().st_size, url_hash))
+            except OSError:
+                sizes.append((0, url_hash))
+        conn.executemany("UPDATE url_cache SET size = ? WHERE url_hash = ?", sizes)
+
+    @classmethod
+    def _get_option_defaults(cls) -> Dict[str, Any]:
+        """
+        Returns the defaults of the options of `Cache.__init__`, they are only looked up once per class.
+        """
+        # looked up in the class' own namespace, so subclasses with other defaults don't get the ones of their parent
+        defaults = cls.__dict__.get("_option_defaults")
+        if defaults is None:
+            import inspect
+
+            parameters = inspect.signature(cls.__init__).parameters
+            defaults = {option: parameters[option].default for option in cls.fork_keys.values()}
+            cls._option_defaults = defaults
+        return defaults
+
+    @classmethod
+    def get_instance(cls, directory: Optional[str], **options) -> Cache:
+        """
+        Returns the cache for this directory and options, creating it only if it doesn't exist yet.
+        The options are the keyword arguments of `Cache.__init__`.
+        """
+        # options that aren't passed are filled with their defaults, so they map to the same instance as explicit ones
+        options = {**cls._get_option_defaults(), **options}
+
+        path = None if directory is None or str(directory).strip() == "" else Path(directory).absolute()
+        key = (path, tuple(sorted(options.items())))
+
+        cache = cls._instances.get(key)
+        if cache is not None:
+            return cache
+
+        with cls._instances_lock:
+            cache = cls._instances.get(key)
+            if cache is None:
+                cache = cls(directory=None if directory is None else str(directory), **options)
+                cls._instances[key] = cache
+        return cache
 
     key_cache_enabled = "cache_enabled"
     key_cache_directory = "cache_directory"
     key_cache_expires_after = "cache_expires_after"
+    key_cache_memory_entries = "cache_memory_entries"
+    key_cache_memory_bytes = "cache_memory_bytes"
+    key_cache_respect_cache_control = "cache_respect_cache_control"
+    key_cache_max_size = "cache_max_size"
+    key_cache_compression = "cache_compression"
+    key_cache_compression_min_size = "cache_compression_min_size"
+    key_cache_vary_headers = "cache_vary_headers"
+    key_cache_write_behind = "cache_write_behind"
+    key_cache_error_expires_after = "cache_error_expires_after"
+    key_cache_stale_if_error = "cache_stale_if_error"
+
+    # maps the keyword arguments of fork to the options of the cache they override
+    fork_keys: Dict[str, str] = {
+        key_cache_expires_after: "expires_after",
+        key_cache_memory_entries: "memory_entries",
+        key_cache_memory_bytes: "memory_bytes",
+        key_cache_respect_cache_control: "respect_cache_control",
+        key_cache_max_size: "max_size",
+        key_cache_compression: "compression",
+        key_cache_compression_min_size: "compression_min_size",
+        key_cache_vary_headers: "vary_headers",
+        key_cache_write_behind: "write_behind",
+        key_cache_error_expires_after: "error_expires_after",
+        key_cache_stale_if_error: "stale_if_error",
+    }
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        return {option: getattr(self, option) for option in self.fork_keys.values()}
+
     def fork(self, **kwargs) -> Cache:
         directory = kwargs.get(self.key_cache_directory)
         if directory is None:
             directory = self._directory
+        else:
+            directory = Path(directory)
         
         if kwargs.get(self.key_cache_enabled) is not None:
             if not kwargs[self.key_cache_enabled]:
@@ -53,18 +351,22 @@ class Cache:
             elif directory is None:
                 raise ValueError("can't enable cache because no cache directory is defined")
 
-        expires_after = kwargs.get(self.key_cache_expires_after)
-        if expires_after is None:
-            expires_after = self.expires_after
+        current_options = self.options
+        options = dict(current_options)
+        for key, option in self.fork_keys.items():
+            if kwargs.get(key) is not None:
+                options[option] = kwargs[key]
+        # has to be hashable to be part of the instance key
+        options["vary_headers"] = tuple(sorted(header.lower() for header in options["vary_headers"]))
 
         # if didn't change can just return current cache
-        if directory == self._directory and expires_after == self.expires_after:
+        if directory == self._directory and options == current_options:
             return self
 
-        logger.debug("forking cache %s %s", directory, expires_after)
-        return Cache(
+        logger.debug("forking cache %s %s", directory, options)
+        return Cache.get_instance(
             directory=None if directory is None else str(directory),
-            expires_after=expires_after,
+            **options,
         )
 
     @property
@@ -80,65 +382,472 @@ class Cache:
     def database_file(self) -> Path:
         return self.directory / "cache_metadata.db"
 
+    @property
+    def database(self) -> sqlite3.Connection:
+        """
+        The sqlite connection of the current thread.
+        It is opened once and reused for every cache operation of that thread.
+        """
+        holder: Optional[_ThreadConnection] = getattr(self._local, "holder", None)
+        if holder is not None:
+            return holder.conn
+
+        import sqlite3
+        self.directory.mkdir(exist_ok=True)
+
+        # the timeout makes concurrent writers from other processes wait instead of raising "database is locked"
+        conn = sqlite3.connect(self.database_file, timeout=30, cached_statements=256, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        # makes INSERT OR REPLACE fire the delete trigger that keeps cache_totals right
+        conn.execute("PRAGMA recursive_triggers=ON")
+
+        # the thread local storage is dropped when the thread ends, which closes the connection through the holder
+        holder = _ThreadConnection(conn)
+        self._local.holder = holder
+        with self._connections_lock:
+            self._connections.add(conn)
+        weakref.finalize(holder, _close_connection, self._connections, self._connections_lock, conn)
+
+        self._initialize(conn)
+        return conn
+
+    def flush(self):
+        """
+        Blocks until every write queued in write behind mode is on disk and committed.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """
+        Flush queued writes and close all sqlite connections this cache opened.
+        The cache stays usable, new connections are opened on demand.
+        """
+        self.flush()
+
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+            local, self._local = self._local, threading.local()
+        # dropping the old thread local storage runs the finalizer of this thread's connection, which takes the lock
+        del local
+
+        for conn in connections:
+            conn.close()
+
     @staticmethod
     def get_hash(*args: str) -> str:
+        """
+        The key scheme of older versions, it is still used to find their entries, see `adopt_legacy_entry`.
+        """
         return sha1(encode("".join(elem.strip() for elem in args), "utf-8")).hexdigest()
 
+    def get_request_hash(
+        self, 
+        method: str, 
+        url: str, 
+        body: Optional[Union[str, bytes]] = None, 
+        headers: Optional[Mapping[str, str]] = None, 
+        identifier: str = "",
+    ) -> str:
+        """
+        The cache key of a request, built from the method, the canonical url, the body and the vary headers.
+        """
+        digest = blake2b(digest_size=20)
+        digest.update(method.upper().encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(canonicalize_url(url).encode("utf-8"))
+        digest.update(b"\0")
+        # streamed bodies (files, generators) can only be read once, they aren't part of the key
+        if isinstance(body, str):
+            digest.update(body.encode("utf-8"))
+        elif isinstance(body, (bytes, bytearray)):
+            digest.update(body)
+        digest.update(b"\0")
+        if self.vary_headers:
+            lower_headers = {} if headers is None else {key.lower(): value for key, value in headers.items()}
+            for header in self.vary_headers:
+                digest.update(f"{header}:{lower_headers.get(header, '')}\n".encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(identifier.strip().encode("utf-8"))
+        return digest.hexdigest()
+
+    def adopt_legacy_entry(self, legacy_hash: str, url_hash: str) -> bool:
+        """
+        Moves an entry that was stored under the key scheme of older versions (`get_hash`) to its new key.
+        Returns if there is a valid entry for `url_hash` afterwards.
+        """
+        if not self.is_enabled:
+            return False
+
+        legacy_file = self.get_url_file(legacy_hash)
+        if not legacy_file.exists():
+            return False
+
+        with self.database as conn:
+            updated = conn.execute(
+                "UPDATE OR REPLACE url_cache SET url_hash = ? WHERE url_hash = ?",
+                (url_hash, legacy_hash)
+            ).rowcount
+        if not updated:
+            return False
+
+        logger.debug("%s - adopting legacy cache entry %s", url_hash, legacy_hash)
+        cache_file = self.get_url_file(url_hash)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(legacy_file, cache_file)
+        return self.has_cache(url_hash)
+
     def get_url_file(self, url_hash: str) -> Path:
-        return self.directory / f"{url_hash}.request"
+        # sharded so no directory ends up with millions of files
+        return self.directory / url_hash[:2] / url_hash[2:4] / f"{url_hash}.request"
 
     def has_cache(self, url_hash: str) -> bool:
         if not self.is_enabled:
             return False
 
+        if self.memory is not None and self.memory.contains(url_hash):
+            return True
+
+        if url_hash in self._pending:
+            return True
+
+        # the database is opened first, because that migrates the cache files of older layouts to where they are looked for
+        conn = self.database
+
         cache_file = self.get_url_file(url_hash)
         if not cache_file.exists():
+            self.disk_misses += 1
             return False
         
         # Check if the cache has expired
-        with sqlite3.connect(self.database_file) as conn:
+        with conn:
             cursor = conn.cursor()
             cursor.execute(
-                "SELECT expires_at FROM url_cache WHERE url_hash = ?",
+                "SELECT expires_at, etag, last_modified, stale_until, stale_if_error_until, last_access FROM url_cache WHERE url_hash = ?",
                 (url_hash,)
             )
             result = cursor.fetchone()
             
             if result is None:
+                self.disk_misses += 1
                 return False  # No expiration record exists
             
+            now = datetime.now()
             expires_at = datetime.fromisoformat(result[0])
-            if datetime.now() > expires_at:
-                # Cache expired, clean it up
-                cache_file.unlink(missing_ok=True)
+            if now > expires_at:
+                # expired entries are kept if they can still be revalidated or served stale
+                can_revalidate = result[1] is not None or result[2] is not None
+                can_serve_stale = result[3] is not None and now <= datetime.fromisoformat(result[3])
+                can_serve_if_error = result[4] is not None and now <= datetime.fromisoformat(result[4])
+                if not can_revalidate and not can_serve_stale and not can_serve_if_error:
+                    # Cache expired, clean it up
+                    cache_file.unlink(missing_ok=True)
+                    cursor.execute(
+                        "DELETE FROM url_cache WHERE url_hash = ?",
+                        (url_hash,)
+                    )
+                self.disk_misses += 1
+                return False
+
+            # a hit is only written if the recorded access is old enough to matter for eviction, so most hits stay read only
+            # and don't take the write lock of the database
+            if result[5] is None or now - datetime.fromisoformat(result[5]) > self.last_access_resolution:
                 cursor.execute(
-                    "DELETE FROM url_cache WHERE url_hash = ?",
-                    (url_hash,)
+                    "UPDATE url_cache SET last_access = ? WHERE url_hash = ?",
+                    (now.isoformat(), url_hash)
                 )
-                conn.commit()
-                return False
         
+        self.disk_hits += 1
         return True
 
+    def has_cache_many(self, url_hashes: Iterable[str]) -> Set[str]:
+        """
+        Checks many hashes with as few queries as possible.
+        Returns the set of hashes that have a valid cache entry.
+        Expired entries are not cleaned up here, that happens in `has_cache`.
+        """
+        if not self.is_enabled:
+            return set()
+
+        url_hashes = list(set(url_hashes))
+        now = datetime.now().isoformat()
+        found: Set[str] = set()
+
+        with self.database as conn:
+            # sqlite limits the number of parameters per query
+            for i in range(0, len(url_hashes), 500):
+                chunk = url_hashes[i:i + 500]
+                cursor = conn.execute(
+                    f"SELECT url_hash FROM url_cache WHERE expires_at >= ? AND url_hash IN ({', '.join('?' * len(chunk))})",
+                    (now, *chunk)
+                )
+                found.update(row[0] for row in cursor.fetchall())
+
+        return {url_hash for url_hash in found if self.get_url_file(url_hash).exists()}
+
+    def get_revalidation(self, url_hash: str) -> Tuple[Dict[str, str], bool]:
+        """
+        Looks up an expired entry that is still on disk.
+        Returns the conditional request headers to revalidate it, 
+        and if it may be served stale while the revalidation happens in the background.
+        """
+        if not self.is_enabled or not self.get_url_file(url_hash).exists():
+            return {}, False
+
+        with self.database as conn:
+            result = conn.execute(
+                "SELECT etag, last_modified, stale_until FROM url_cache WHERE url_hash = ?",
+                (url_hash,)
+            ).fetchone()
+
+        if result is None:
+            return {}, False
+
+        headers = {}
+        if result[0] is not None:
+            headers["If-None-Match"] = result[0]
+        if result[1] is not None:
+            headers["If-Modified-Since"] = result[1]
+
+        serve_stale = result[2] is not None and datetime.now() <= datetime.fromisoformat(result[2])
+        return headers, serve_stale
+
+    def get_stale_if_error(self, url_hash: str) -> Optional[requests.Response]:
+        """
+        Returns the entry even if it expired, as long as it is within its stale-if-error grace period.
+        Returns None if there is no such entry.
+        """
+        if not self.is_enabled or not self.get_url_file(url_hash).exists():
+            return None
+
+        with self.database as conn:
+            result = conn.execute("SELECT stale_if_error_until FROM url_cache WHERE url_hash = ?", (url_hash,)).fetchone()
+
+        if result is None or result[0] is None or datetime.now() > datetime.fromisoformat(result[0]):
+            return None
+        return self.get_cache(url_hash)
+
+    def get_freshness(self, response: requests.Response) -> Tuple[datetime, Optional[datetime], Optional[datetime]]:
+        """
+        Returns until when the response is fresh, until when it may be served stale while revalidating,
+        and until when it may be served stale if the server fails.
+        Error responses are fresh for `error_expires_after` and never served stale.
+        """
+        now = datetime.now()
+        if response.status_code >= 400:
+            return now + self.error_expires_after, None, None
+
+        expires_at = now + self.expires_after
+        stale_until = None
+        stale_if_error = self.stale_if_error
+
+        if self.respect_cache_control:
+            directives = parse_cache_control(response.headers.get("Cache-Control", ""))
+
+            max_age = directives.get("s-maxage", directives.get("max-age"))
+            if max_age is not None and max_age.isdigit():
+                expires_at = now + timedelta(seconds=int(max_age))
+
+            stale_while_revalidate = directives.get("stale-while-revalidate")
+            if stale_while_revalidate is not None and stale_while_revalidate.isdigit():
+                stale_until = expires_at + timedelta(seconds=int(stale_while_revalidate))
+
+            stale_if_error_directive = directives.get("stale-if-error")
+            if stale_if_error_directive is not None and stale_if_error_directive.isdigit():
+                stale_if_error = timedelta(seconds=int(stale_if_error_directive))
+
+        stale_if_error_until = expires_at + stale_if_error if stale_if_error > timedelta(0) else None
+        return expires_at, stale_until, stale_if_error_until
+
+    def refresh_cache(self, url_hash: str, response: requests.Response) -> requests.Response:
+        """
+        Marks an expired entry as fresh again after the server confirmed it didn't change (`304 Not Modified`).
+        Returns the cached response.
+        """
+        logger.info("%s - not modified, refreshing cache", url_hash)
+        expires_at, stale_until, stale_if_error_until = self.get_freshness(response)
+
+        with self.database as conn:
+            conn.execute(
+                """
+                UPDATE url_cache 
+                SET expires_at = ?, stale_until = ?, stale_if_error_until = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                WHERE url_hash = ?
+                """,
+                (
+                    expires_at.isoformat(), 
+                    None if stale_until is None else stale_until.isoformat(), 
+                    None if stale_if_error_until is None else stale_if_error_until.isoformat(), 
+                    response.headers.get("ETag"), 
+                    response.headers.get("Last-Modified"), 
+                    url_hash,
+                )
+            )
+
+        if self.memory is not None:
+            self.memory.remove(url_hash)
+        return self.get_cache(url_hash)
+
     def get_cache(self, url_hash: str) -> requests.Response:
         logger.info("%s - returning cache", url_hash)
-        with self.get_url_file(url_hash).open("rb") as cache_file:
-            return pickle.load(cache_file)
 
-    def write_cache(self, url_hash: str, response: requests.Response):
-        expires_at = datetime.now() + self.expires_after
+        if self.memory is not None:
+            response = self.memory.get(url_hash)
+            if response is not None:
+                return response
+
+        response = self._pending.get(url_hash)
+        if response is not None:
+            return copy.copy(response)
+
+        from .cached_response import load_response
+        response = load_response(self.get_url_file(url_hash))
+
+        if self.memory is not None:
+            with self.database as conn:
+                result = conn.execute("SELECT expires_at FROM url_cache WHERE url_hash = ?", (url_hash,)).fetchone()
+            if result is not None:
+                self.memory.put(url_hash, response, datetime.fromisoformat(result[0]))
+
+        return response
+
+    def write_cache(self, url_hash: str, response: requests.Response, body: Optional[BinaryIO] = None):
+        """
+        Writes the response to the cache.
+        If `body` is given it is streamed into the cache file instead of `response.content`.
+        In write behind mode the response is only queued, a background thread writes it and commits the index for many responses at once.
+        """
+        if self.respect_cache_control and "no-store" in parse_cache_control(response.headers.get("Cache-Control", "")):
+            logger.debug("%s - not caching, response is no-store", url_hash)
+            return
+
+        # a body stream can't wait in the queue, it might be closed by the time the writer gets to it
+        if self.write_behind and body is None:
+            # read the content now, so the writer never touches the connection of the response
+            response.content
+            with self._pending_lock:
+                self._pending[url_hash] = response
+            self._get_writer().put((url_hash, response))
+            return
+
+        self._write_index([self._write_file(url_hash, response, body)])
+        self.enforce_max_size()
+
+    def _get_writer(self) -> BackgroundWriter:
+        if self._writer is None:
+            with self._pending_lock:
+                if self._writer is None:
+                    self._writer = BackgroundWriter(self._write_batch, max_queue=self.write_behind_queue_size)
+                    # the writer is a daemon thread, without this the queued writes would be lost when the interpreter exits
+                    atexit.register(self.flush)
+        return self._writer
+
+    # how many responses may wait for the background writer before write_cache blocks
+    write_behind_queue_size = 1024
+
+    def _write_batch(self, batch: List[Tuple[str, requests.Response]]):
+        rows = []
+        try:
+            for url_hash, response in batch:
+                try:
+                    rows.append(self._write_file(url_hash, response))
+                except OSError as e:
+                    logger.warning("%s - writing cache file failed: %s", url_hash, e)
+
+            # one transaction for the whole batch, so there is only one commit
+            self._write_index(rows)
+            self.enforce_max_size()
+        finally:
+            with self._pending_lock:
+                for url_hash, response in batch:
+                    # a newer response for the same hash might be queued already
+                    if self._pending.get(url_hash) is response:
+                        del self._pending[url_hash]
+
+    def _write_file(self, url_hash: str, response: requests.Response, body: Optional[BinaryIO] = None) -> tuple:
+        """
+        Writes the cache file and returns the row for the index.
+        """
+        from .cached_response import dump_response
+
+        expires_at, stale_until, stale_if_error_until = self.get_freshness(response)
         
-        # Write the cache file
-        with self.get_url_file(url_hash).open("wb") as url_file:
-            pickle.dump(response, url_file)
+        # Write the cache file, it is replaced instead of overwritten because readers might have it memory mapped
+        cache_file = self.get_url_file(url_hash)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with temp_file.open("wb") as url_file:
+            dump_response(
+                response, 
+                url_file, 
+                body=body, 
+                compression=self.compression, 
+                compression_min_size=self.compression_min_size,
+            )
+            size = url_file.tell()
+        os.replace(temp_file, cache_file)
+
+        if self.memory is not None:
+            if body is None:
+                self.memory.put(url_hash, response, expires_at)
+            else:
+                self.memory.remove(url_hash)
         
-        # Update the database
-        with sqlite3.connect(self.database_file) as conn:
-            conn.execute(
-                "INSERT OR REPLACE INTO url_cache (url_hash, expires_at) VALUES (?, ?)",
-                (url_hash, expires_at.isoformat())
+        return (
+            url_hash, 
+            expires_at.isoformat(), 
+            response.headers.get("ETag"), 
+            response.headers.get("Last-Modified"), 
+            None if stale_until is None else stale_until.isoformat(),
+            None if stale_if_error_until is None else stale_if_error_until.isoformat(),
+            size,
+            datetime.now().isoformat(),
+        )
+
+    def _write_index(self, rows: List[tuple]):
+        with self.database as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO url_cache (url_hash, expires_at, etag, last_modified, stale_until, stale_if_error_until, size, last_access) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
             )
-            conn.commit()
+
+    def enforce_max_size(self) -> int:
+        """
+        Evicts the least recently used entries until the cache is smaller than max_size.
+        Returns the number of evicted entries.
+        """
+        if self.max_size <= 0:
+            return 0
+
+        with self.database as conn:
+            total_bytes = conn.execute("SELECT bytes FROM cache_totals").fetchone()[0]
+            if total_bytes <= self.max_size:
+                return 0
+
+            to_free = total_bytes - self.max_size
+            evicted = []
+            for url_hash, size in conn.execute("SELECT url_hash, size FROM url_cache ORDER BY last_access"):
+                evicted.append((url_hash,))
+                to_free -= size or 0
+                if to_free <= 0:
+                    break
+
+            conn.executemany("DELETE FROM url_cache WHERE url_hash = ?", evicted)
+
+        logger.debug("evicting %s entries to stay below %s bytes", len(evicted), self.max_size)
+        for (url_hash,) in evicted:
+            self.get_url_file(url_hash).unlink(missing_ok=True)
+            if self.memory is not None:
+                self.memory.remove(url_hash)
+
+        return len(evicted)
 
     def clean_cache(self) -> Tuple[int, int]:
         """
@@ -149,7 +858,7 @@ class Cache:
         files_deleted = 0
         db_entries_deleted = 0
 
-        with sqlite3.connect(self.database_file) as conn:
+        with self.database as conn:
             # Get all expired entries
             cursor = conn.cursor()
             cursor.execute(
@@ -160,7 +869,7 @@ class Cache:
             
             # Delete the files and count deletions
             for url_hash in expired_hashes:
-                cache_file = Path(self.directory, f"{url_hash}.request")
+                cache_file = self.get_url_file(url_hash)
                 try:
                     if cache_file.exists():
                         cache_file.unlink()
@@ -174,7 +883,6 @@ class Cache:
                 (now.isoformat(),)
             )
             db_entries_deleted = cursor.rowcount
-            conn.commit()
         
         return (files_deleted, db_entries_deleted)
 
@@ -186,62 +894,313 @@ class Cache:
         files_deleted = 0
         db_entries_deleted = 0
 
+        # queued writes would otherwise end up in the cleared cache
+        self.flush()
+        if self.memory is not None:
+            self.memory.clear()
+
         # Delete all cache files
-        for cache_file in Path(self.directory).glob("*.request"):
+        with self.database as conn:
+            url_hashes = [row[0] for row in conn.execute("SELECT url_hash FROM url_cache").fetchall()]
+
+        for url_hash in url_hashes:
             try:
-                cache_file.unlink()
+                self.get_url_file(url_hash).unlink()
                 files_deleted += 1
             except OSError:
                 continue
         
         # Delete all database entries
-        with sqlite3.connect(self.database_file) as conn:
+        with self.database as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM url_cache")
             db_entries_deleted = cursor.rowcount
-            conn.commit()
+            cursor.execute("UPDATE cache_totals SET entries = 0, bytes = 0")
         
         return (files_deleted, db_entries_deleted)
 
-    def get_cache_stats(self) -> Tuple[int, int]:
+    # archives written by export are tar files, the first member is the index followed by one member per cache file
+    archive_version = 1
+    _archive_index_name = "index.jsonl"
+    _archive_columns = ("url_hash", "expires_at", "etag", "last_modified", "stale_until", "stale_if_error_until", "size")
+
+    def export(self, path: Union[str, Path], filter: Optional[Callable[[Dict[str, Any]], bool]] = None) -> int:
         """
-        Get cache statistics.
-        Returns tuple of (total_files, total_db_entries)
+        Packs the index and the cache files into one archive, that can be loaded into another cache with `import_`.
+        The archive is written as a stream and gzip compressed if `path` ends with `.gz`.
+        `filter` gets the index columns and the `url` of every entry and decides if it is exported.
+        Entries that can neither be served nor revalidated anymore are left out.
+        Returns the number of exported entries.
         """
+        import tarfile
+        import tempfile
+        from .cached_response import load_response, read_header
 
-        # Count cache files
-        total_files = len(list(self.directory.glob("*.request")))
-        
-        # Count database entries
-        with sqlite3.connect(self.database_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM url_cache")
-            total_db_entries = cursor.fetchone()[0]
-        
-        return (total_files, total_db_entries)
+        self.flush()
+
+        path = Path(path)
+        now = datetime.now().isoformat()
+        with self.database as conn:
+            rows = conn.execute(
+                f"""
+                SELECT {', '.join(self._archive_columns)} FROM url_cache 
+                WHERE expires_at >= ? OR stale_until >= ? OR stale_if_error_until >= ? OR etag IS NOT NULL OR last_modified IS NOT NULL
+                """,
+                (now, now, now)
+            ).fetchall()
+
+        # the index has to be complete before the first cache file is written, so it is spooled to disk if it gets large
+        exported = 0
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as index:
+            index.write((json.dumps({"version": self.archive_version}) + "\n").encode())
+
+            url_hashes = []
+            for row in rows:
+                entry = dict(zip(self._archive_columns, row))
+                cache_file = self.get_url_file(entry["url_hash"])
+                if not cache_file.exists():
+                    continue
+
+                if filter is not None:
+                    header = read_header(cache_file)
+                    entry["url"] = load_response(cache_file).url if header is None else header["url"]
+                    if not filter(entry):
+                        continue
+                    del entry["url"]
+
+                index.write((json.dumps(entry) + "\n").encode())
+                url_hashes.append(entry["url_hash"])
+
+            mode = "w|gz" if path.suffix == ".gz" else "w|"
+            with tarfile.open(str(path), mode) as archive:
+                info = tarfile.TarInfo(self._archive_index_name)
+                info.size = index.tell()
+                info.mtime = int(datetime.now().timestamp())
+                index.seek(0)
+                archive.addfile(info, index)
+
+                for url_hash in url_hashes:
+                    try:
+                        cache_file = self.get_url_file(url_hash).open("rb")
+                    except FileNotFoundError:
+                        # evicted in the meantime, import_ ignores index entries without a cache file
+                        continue
+
+                    with cache_file:
+                        stat = os.fstat(cache_file.fileno())
+                        info = tarfile.TarInfo(f"{url_hash}.request")
+                        info.size = stat.st_size
+                        info.mtime = int(stat.st_mtime)
+                        archive.addfile(info, cache_file)
+                    exported += 1
+
+        logger.info("exported %s entries of %s to %s", exported, self.directory, path)
+        return exported
+
+    def import_(self, path: Union[str, Path]) -> Tuple[int, int]:
+        """
+        Unpacks an archive written by `export` into this cache.
+        An entry that already exists is only replaced if the imported one expires later.
+        Returns tuple of (entries_imported, entries_skipped)
+        """
+        import shutil
+        import tarfile
+        from .cached_response import PREAMBLE_SIZE, has_preamble
+
+        path = Path(path)
+        imported = 0
+        skipped = 0
+
+        with tarfile.open(str(path), "r|*") as archive:
+            entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+            for member in archive:
+                if entries is None:
+                    if member.name != self._archive_index_name:
+                        raise ValueError(f"{path} is not a cache archive, it doesn't start with {self._archive_index_name}")
+                    entries = self._read_archive_index(archive.extractfile(member), path)
+                    continue
+
+                url_hash = member.name[:-len(".request")] if member.name.endswith(".request") else ""
+                entry = entries.get(url_hash)
+                # the hash becomes part of a path, so anything else than a hex digest is rejected
+                if entry is None or not member.isfile() or _HASH_PATTERN.fullmatch(url_hash) is None:
+                    skipped += 1
+                    continue
+
+                with self.database as conn:
+                    existing = conn.execute("SELECT expires_at FROM url_cache WHERE url_hash = ?", (url_hash,)).fetchone()
+                if existing is not None and datetime.fromisoformat(existing[0]) >= datetime.fromisoformat(entry["expires_at"]):
+                    skipped += 1
+                    continue
+
+                # files without the preamble would be unpickled when they are loaded, which can run arbitrary code
+                member_file = archive.extractfile(member)
+                preamble = member_file.read(PREAMBLE_SIZE) if member_file is not None else b""
+                if not has_preamble(preamble):
+                    logger.warning("skipping %s from %s, it isn't a cache file of a supported version", member.name, path)
+                    skipped += 1
+                    continue
+
+                cache_file = self.get_url_file(url_hash)
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+                with temp_file.open("wb") as f:
+                    f.write(preamble)
+                    shutil.copyfileobj(member_file, f, 1024 * 1024)
+                    size = f.tell()
+                os.replace(temp_file, cache_file)
+
+                if self.memory is not None:
+                    self.memory.remove(url_hash)
+
+                with self.database as conn:
+                    conn.execute(
+                        """
+                        INSERT OR REPLACE INTO url_cache (url_hash, expires_at, etag, last_modified, stale_until, stale_if_error_until, size, last_access) 
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            url_hash,
+                            entry["expires_at"],
+                            entry["etag"],
+                            entry["last_modified"],
+                            entry["stale_until"],
+                            # archives written before stale-if-error existed don't have it
+                            entry.get("stale_if_error_until"),
+                            size,
+                            datetime.now().isoformat(),
+                        )
+                    )
+                imported += 1
+
+        if entries is None:
+            raise ValueError(f"{path} is not a cache archive, it is empty")
+
+        self.enforce_max_size()
+        logger.info("imported %s entries from %s into %s, skipped %s", imported, path, self.directory, skipped)
+        return imported, skipped
+
+    def _read_archive_index(self, file: Optional[BinaryIO], path: Path) -> Dict[str, Dict[str, Any]]:
+        if file is None:
+            raise ValueError(f"{path} is not a cache archive, the index isn't a file")
+
+        lines = iter(file)
+        header = json.loads(next(lines))
+        if header.get("version") != self.archive_version:
+            raise ValueError(f"unsupported cache archive version {header.get('version')} in {path}")
+
+        entries = {}
+        for line in lines:
+            entry = json.loads(line)
+            entries[entry["url_hash"]] = entry
+        return entries
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics, read from the index.
+        Returns dict with the number of entries, the bytes used, the hit rate and the counters of `get_hit_stats`
+        """
+        with self.database as conn:
+            total_entries, total_bytes = conn.execute("SELECT entries, bytes FROM cache_totals").fetchone()
+
+        hit_stats = self.get_hit_stats()
+        hits = hit_stats["memory_hits"] + hit_stats["disk_hits"]
+        lookups = hits + hit_stats["disk_misses"]
+
+        return {
+            "entries": total_entries,
+            "bytes": total_bytes,
+            "max_size": self.max_size,
+            "hit_rate": hits / lookups if lookups > 0 else 0.0,
+            **hit_stats,
+        }
+
+    def get_hit_stats(self) -> Dict[str, int]:
+        """
+        Get the hit and miss counters of the memory and disk tier.
+        A lookup only reaches the disk tier if the memory tier missed.
+        """
+        return {
+            "memory_hits": 0 if self.memory is None else self.memory.hits,
+            "memory_misses": 0 if self.memory is None else self.memory.misses,
+            "memory_entries": 0 if self.memory is None else len(self.memory),
+            "memory_bytes": 0 if self.memory is None else self.memory.size,
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+        }
+
+
+
+# the default cache, it is only created when it is used for the first time, see get_root_cache
+_root_cache: Optional[Cache] = None
+
+
+def get_root_cache() -> Cache:
+    global _root_cache
+    if _root_cache is None:
+        _root_cache = Cache.get_instance(
+            directory=os.getenv("EASY_REQUESTS_CACHE_DIR"),
+            expires_after=timedelta(
+                days=float(os.getenv("EASY_REQUESTS_CACHE_EXPIRES", 1))
+            ),
+        )
+    return _root_cache
 
 
+def __getattr__(name: str) -> Any:
+    # ROOT_CACHE used to be created on import, it stays available as a lazily created attribute
+    if name == "ROOT_CACHE":
+        return get_root_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-ROOT_CACHE: Cache = Cache(
-    directory=os.getenv("EASY_REQUESTS_CACHE_DIR"),
-    expires_after=timedelta(
-        days=float(os.getenv("EASY_REQUESTS_CACHE_EXPIRES", 1))
-    ),
-)
 
-def init_cache(directory: str, expires_after: timedelta = timedelta(days=float(os.getenv("EASY_REQUESTS_CACHE_EXPIRES", 1)))):
+def init_cache(
+    directory: str, 
+    expires_after: timedelta = timedelta(days=float(os.getenv("EASY_REQUESTS_CACHE_EXPIRES", 1))),
+    memory_entries: Optional[int] = None,
+    memory_bytes: Optional[int] = None,
+    respect_cache_control: Optional[bool] = None,
+    max_size: Optional[int] = None,
+    compression: Optional[str] = None,
+    compression_min_size: Optional[int] = None,
+    vary_headers: Optional[Tuple[str, ...]] = None,
+    write_behind: Optional[bool] = None,
+    error_expires_after: Optional[timedelta] = None,
+    stale_if_error: Optional[timedelta] = None,
+):
     """Configure the default cache storage location and expiration time.
 
     Args:
         directory: Cache storage directory path.
         expires_after: Cache expiration duration.
+        memory_entries: Number of responses kept in the in memory tier, 0 disables it.
+        memory_bytes: Maximum total body size of the in memory tier.
+        respect_cache_control: Use max-age and stale-while-revalidate of responses instead of expires_after.
+        max_size: Bytes the cache may take up on disk before least recently used entries are evicted, 0 means unlimited.
+        compression: Codec for cached bodies: none, zlib, lzma, zstd (if installed) or auto.
+        compression_min_size: Bodies smaller than this are stored uncompressed.
+        vary_headers: Request headers that are part of the cache key.
+        write_behind: Write responses in a background thread that commits the index in batches.
+        error_expires_after: How long error responses are cached, 0 means they aren't.
+        stale_if_error: How long expired entries are kept to be served if the server fails.
     
     Example:
         >>> init_cache('/tmp/cache', timedelta(hours=6))  # 6-hour expiration
         >>> init_cache('/tmp/cache')  # Uses default expiration (1 day)
     """
-    global ROOT_CACHE
+    global _root_cache
     cache_directory = directory
     cache_expires_after = expires_after
-    ROOT_CACHE = ROOT_CACHE.fork(**locals())
+    cache_memory_entries = memory_entries
+    cache_memory_bytes = memory_bytes
+    cache_respect_cache_control = respect_cache_control
+    cache_max_size = max_size
+    cache_compression = compression
+    cache_compression_min_size = compression_min_size
+    cache_vary_headers = vary_headers
+    cache_write_behind = write_behind
+    cache_error_expires_after = error_expires_after
+    cache_stale_if_error = stale_if_error
+    _root_cache = get_root_cache().fork(**locals())
 
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import io
+import json
+import mmap
+import shutil
+import struct
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+import requests
+
+from .compression import Codec, DecompressingReader, get_codec, resolve_codec_name
+
+
+# on disk format of a cached response:
+#
+#     MAGIC | version (1 byte) | header length (uint32, big endian) | header (json) | body
+#
+# the header holds everything but the body, the body is the raw content of the response,
+# compressed with the codec named in the header (since version 2).
+# files that don't start with MAGIC are pickled responses of older versions.
+
+MAGIC = b"ERQC"
+VERSION = 2
+SUPPORTED_VERSIONS = {1, 2}
+_PREAMBLE = struct.Struct(">4sBI")
+PREAMBLE_SIZE = _PREAMBLE.size
+
+
+class CachedResponse(requests.Response):
+    """
+    A response loaded from the cache.
+    The body is a memory mapped view of the cache file, it only gets copied (and decompressed) once `.content` or `.text` is accessed.
+    """
+
+    def __init__(self, body: memoryview, codec: Optional[Codec] = None):
+        super().__init__()
+        self.body = body
+        self.codec = codec
+        self.from_cache = True
+
+    @property
+    def content(self) -> bytes:  # type: ignore[override]
+        if self._content is False:
+            self._content = bytes(self.body) if self.codec is None else self.codec.decompressor().decompress(self.body)
+            self._content_consumed = True
+        return self._content  # type: ignore[return-value]
+
+    def close(self):
+        # `raw` can be the mapping `body` is a view of, closing it would raise while the view exists.
+        # it is shared with copies from the memory tier as well, so it is unmapped once nothing references it anymore
+        pass
+
+
+def dump_response(
+    response: requests.Response, 
+    file: BinaryIO, 
+    body: Optional[BinaryIO] = None, 
+    compression: Optional[str] = None, 
+    compression_min_size: int = 0,
+):
+    """
+    Writes the response to `file`.
+    If `body` is given it is streamed into the file instead of `response.content`.
+    Bodies of at least `compression_min_size` bytes are compressed with `compression`.
+    """
+
+    if body is None:
+        size = len(response.content)
+    else:
+        start = body.tell()
+        size = body.seek(0, io.SEEK_END) - start
+        body.seek(start)
+
+    codec_name = resolve_codec_name(compression) if size >= compression_min_size else "none"
+    codec = get_codec(codec_name)
+
+    header = {
+        "status_code": response.status_code,
+        "reason": response.reason,
+        "url": response.url,
+        "encoding": response.encoding,
+        "headers": list(response.headers.items()),
+        "elapsed": response.elapsed.total_seconds(),
+        "request": None if response.request is None else {
+            "method": response.request.method,
+            "url": response.request.url,
+        },
+        "codec": codec_name,
+    }
+    encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+    file.write(_PREAMBLE.pack(MAGIC, VERSION, len(encoded_header)))
+    file.write(encoded_header)
+    if codec is None:
+        if body is None:
+            file.write(response.content)
+        else:
+            shutil.copyfileobj(body, file)
+        return
+
+    compressor = codec.compressor()
+    if body is None:
+        file.write(compressor.compress(response.content))
+    else:
+        while chunk := body.read(1024 * 1024):
+            file.write(compressor.compress(chunk))
+    file.write(compressor.flush())
+
+
+def has_preamble(data: bytes) -> bool:
+    """
+    If `data` starts with the preamble of a cache file in a supported version.
+    Files from untrusted sources must be checked with it, anything without it would be unpickled by `load_response`.
+    """
+    if len(data) < _PREAMBLE.size or not data.startswith(MAGIC):
+        return False
+    _, version, _ = _PREAMBLE.unpack(data[:_PREAMBLE.size])
+    return version in SUPPORTED_VERSIONS
+
+
+def read_header(path: Path) -> Optional[dict]:
+    """
+    Reads only the header of a cache file, without loading the body.
+    Returns None for the pickled files of older versions.
+    """
+    with path.open("rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size or not preamble.startswith(MAGIC):
+            return None
+
+        _, version, header_length = _PREAMBLE.unpack(preamble)
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"unsupported cache file version {version} in {path}")
+        return json.loads(f.read(header_length))
+
+
+def load_response(path: Path) -> requests.Response:
+    with path.open("rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            # cache files written before the binary format was introduced
+            import pickle
+            f.seek(0)
+            return pickle.load(f)
+
+        # the mapping stays valid after the file is closed, and cache files are only ever replaced, never truncated
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    _, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"unsupported cache file version {version} in {path}")
+
+    header_end = _PREAMBLE.size + header_length
+    header = json.loads(buffer[_PREAMBLE.size:header_end])
+
+    codec = get_codec(header.get("codec"))
+    response = CachedResponse(memoryview(buffer)[header_end:], codec=codec)
+    response.status_code = header["status_code"]
+    response.reason = header["reason"]
+    response.url = header["url"]
+    response.encoding = header["encoding"]
+    response.headers = requests.structures.CaseInsensitiveDict(header["headers"])
+    response.elapsed = timedelta(seconds=header["elapsed"])
+
+    # allows iter_content to stream the body straight from the mapping
+    if codec is None:
+        buffer.seek(header_end)
+        response.raw = buffer
+    else:
+        response.raw = DecompressingReader(response.body, codec)
+
+    request: Optional[dict] = header["request"]
+    if request is not None:
+        prepared = requests.PreparedRequest()
+        prepared.method = request["method"]
+        prepared.url = request["url"]
+        response.request = prepared
+
+    return response
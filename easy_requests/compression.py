@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import io
+import lzma
+import zlib
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec(NamedTuple):
+    # both return incremental objects, with `compress`/`flush` and `decompress` respectively
+    compressor: Callable[[], Any]
+    decompressor: Callable[[], Any]
+
+
+class _ZstdDecompressor:
+    """Gives the zstandard decompressor the same interface as the stdlib ones."""
+
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+CODECS: Dict[str, Codec] = {
+    "zlib": Codec(compressor=lambda: zlib.compressobj(6), decompressor=zlib.decompressobj),
+    "lzma": Codec(compressor=lzma.LZMACompressor, decompressor=lzma.LZMADecompressor),
+}
+
+if zstandard is not None:
+    CODECS["zstd"] = Codec(compressor=lambda: zstandard.ZstdCompressor(level=3).compressobj(), decompressor=_ZstdDecompressor)
+
+
+def resolve_codec_name(name: Optional[str]) -> str:
+    """
+    Normalizes the configured compression, `"auto"` picks the fastest installed codec.
+    """
+    if name is None:
+        return "none"
+    if name == "auto":
+        return "zstd" if "zstd" in CODECS else "zlib"
+    return name
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    """
+    Returns the codec called `name`, or None if it means no compression.
+    """
+    name = resolve_codec_name(name)
+    if name == "none":
+        return None
+
+    if name not in CODECS:
+        raise ValueError(f"unknown compression {name}, available are none, auto, {', '.join(CODECS)}")
+    return CODECS[name]
+
+
+class DecompressingReader(io.RawIOBase):
+    """Decompresses a buffer incrementally, so it can be read in chunks without decompressing everything at once."""
+
+    def __init__(self, data: memoryview, codec: Codec, chunk_size: int = 64 * 1024):
+        self._data = data
+        self._position = 0
+        self._decompressor = codec.decompressor()
+        self._chunk_size = chunk_size
+        # decompressed bytes that weren't read yet start at `_offset`, so small reads don't copy the rest of the buffer
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self._buffer) - self._offset < size) and self._position < len(self._data):
+            chunk = self._data[self._position:self._position + self._chunk_size]
+            self._position += len(chunk)
+            self._buffer += self._decompressor.decompress(chunk)
+
+        if size < 0:
+            size = len(self._buffer) - self._offset
+        result = bytes(self._buffer[self._offset:self._offset + size])
+        self._offset += len(result)
+
+        # drops the read bytes once they make up most of the buffer, which keeps the copying linear
+        if self._offset * 2 >= len(self._buffer):
+            del self._buffer[:self._offset]
+            self._offset = 0
+        return result
@@ -1,38 +1,66 @@
 from __future__ import annotations
-from typing import Optional, Set
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import timedelta
 import time
 import logging
 from urllib.parse import urlparse, urlunparse
 import json
+import os
+import errno
+import copy
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 from . import cache as c
+from .rate_limit import AdaptiveRateLimiter, HostRateLimiter, RateLimiter
+from .metrics import Metrics
+from .retry import RetryPolicy
+from .scheduler import Scheduler
+from .single_flight import SingleFlight
 
 
 logger = logging.getLogger("easy_requests")
 
 
-class Connection:
-    """Initialize a Connection with request and caching configuration.
+def _parse_content_range(content_range: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """
+    Parses `bytes start-end/size`, returns None if the size is unknown or the header is missing.
+    """
+    if content_range is None:
+        return None
+    unit, _, value = content_range.strip().partition(" ")
+    byte_range, _, size = value.partition("/")
+    start, _, end = byte_range.partition("-")
+    if unit != "bytes" or not (start.isdigit() and end.isdigit() and size.isdigit()):
+        return None
+    return int(start), int(end), int(size)
 
-    Args:
-        session: Existing requests Session to use (creates new if None).  
-        headers: Default headers to add to all requests.
 
-        request_delay: Base delay between requests in seconds.
-        max_retries: Maximum number of retry attempts for failed requests.
-        additional_delay_per_try: Extra delay added per retry attempt.
-        
-        error_status_codes: HTTP status codes that trigger immediate failure.
-        warning_status_codes: HTTP status code that trigger immediate failure but won't raise an error
-        rate_limit_status_codes: HTTP status codes that trigger retries.
+def _write_at(fd: int, data: bytes, offset: int, lock: threading.Lock):
+    # pwrite doesn't move the shared file position, without it seeking and writing has to happen under the lock
+    if hasattr(os, "pwrite"):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
 
-        cache_enabled: Whether response caching is enabled.
-        cache_directory: Directory path for cached responses.
-        cache_expires_after: Duration before cached responses expire.
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+
+
+class BaseConnection:
+    """The configuration, response validation and cache handling shared by Connection and AsyncConnection.
+    The subclasses implement how requests are sent, see `Connection` for the arguments.
     """
-            
+
     def __init__(
         self, 
 
@@ -42,6 +70,10 @@ class Connection:
         request_delay: float = 0,
         max_retries: Optional[int] = 5,
         additional_delay_per_try: float = 1,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        adaptive_rate_limit: bool = False,
+        metrics: Optional[Metrics] = None,
 
         error_status_codes: Optional[Set[int]] = None,
         warning_status_codes: Optional[Set[int]] = None,
@@ -50,6 +82,16 @@ class Connection:
         cache_enabled: Optional[bool] = None,
         cache_directory: Optional[str] = None,
         cache_expires_after: Optional[timedelta] = None,
+        cache_memory_entries: Optional[int] = None,
+        cache_memory_bytes: Optional[int] = None,
+        cache_respect_cache_control: Optional[bool] = None,
+        cache_max_size: Optional[int] = None,
+        cache_compression: Optional[str] = None,
+        cache_compression_min_size: Optional[int] = None,
+        cache_vary_headers: Optional[Tuple[str, ...]] = None,
+        cache_write_behind: Optional[bool] = None,
+        cache_error_expires_after: Optional[timedelta] = None,
+        cache_stale_if_error: Optional[timedelta] = None,
     ) -> None:
 
 
@@ -60,15 +102,33 @@ class Connection:
         # cache related config
         new_kwargs = locals()
         new_kwargs.pop("self")
-        self.cache = c.ROOT_CACHE.fork(**new_kwargs)
+        self.cache = c.get_root_cache().fork(**new_kwargs)
 
-        # values to calculate next request
-        self.last_request: float = 0
+        # requests with these methods are coalesced while they are in flight, see `single_flight` of the subclasses
+        self.coalesce_methods: Set[str] = {"GET", "HEAD"}
+
+        # hashes of stale entries that are revalidated in the background, so every entry is only revalidated once at a time
+        self._revalidating: Set[str] = set()
+        self._revalidating_lock = threading.Lock()
 
         # simple config
         self.max_retries = max_retries
         self.request_delay = request_delay
         self.additional_delay_per_try = additional_delay_per_try
+        self.retry_policy: RetryPolicy = retry_policy if retry_policy is not None else RetryPolicy(backoff_factor=additional_delay_per_try)
+
+        # decides how long to wait before the next request
+        if rate_limiter is None and adaptive_rate_limit:
+            # the learned rates are kept next to the cache, so the next run starts near the right speed
+            # and shared by every connection using the same cache, so they don't overwrite each other's rates
+            if self.cache.is_enabled:
+                rate_limiter = AdaptiveRateLimiter.for_state_file(self.cache.directory / "rate_limits.json", request_delay)
+            else:
+                rate_limiter = AdaptiveRateLimiter.from_delay(request_delay)
+        self.rate_limiter: RateLimiter = rate_limiter if rate_limiter is not None else HostRateLimiter.from_delay(request_delay)
+
+        # only measures anything if metrics were passed, so unused instrumentation costs nothing
+        self.metrics: Optional[Metrics] = metrics
 
         # response validation config
         self.error_status_codes = error_status_codes if error_status_codes is not None else {
@@ -147,16 +207,256 @@ class Connection:
             
         return True
 
-    def _send_request(self, request: requests.Request, attempt: int = 0, cache: Optional[c.Cache] = None, **kwargs) -> requests.Response:
+    def _get_cached(self, cache: c.Cache, url_hash: str) -> requests.Response:
+        response = cache.get_cache(url_hash)
+        # negatively cached error responses fail the same way they did when they were fetched
+        if response.status_code in self.error_status_codes and response.status_code not in self.warning_status_codes:
+            self.validate_response(response)
+        return response
+
+    def _handle_failure(self, error: requests.RequestException, cache: c.Cache, url_hash: str) -> requests.Response:
+        """
+        Called once a request failed for good. If the server is at fault and an expired entry is still within its 
+        stale-if-error grace period, that entry is served instead. Otherwise error responses are negatively cached and `error` is raised.
+        """
+        response = error.response
+        if cache.is_enabled:
+            server_failed = response is None or response.status_code >= 500 or response.status_code in self.rate_limit_status_codes
+            if server_failed:
+                stale = cache.get_stale_if_error(url_hash)
+                if stale is not None:
+                    logger.warning("%s - serving stale cache because the request failed: %s", url_hash, error)
+                    return stale
+
+            if response is not None and response.status_code in self.error_status_codes and cache.error_expires_after > timedelta(0):
+                cache.write_cache(url_hash, response)
+
+        raise error
+
+    def get_request_hash(self, request: requests.Request, cache: Optional[c.Cache] = None, cache_identifier: str = "") -> str:
+        """
+        The cache key of `request`, see `Cache.get_request_hash`.
+        The request is prepared first, so the body is encoded and the session headers are included.
+        """
+        cache = self.cache if cache is None else cache
+        if self._has_streamed_body(request):
+            # preparing would read uploaded files, which then would be sent empty
+            return cache.get_request_hash(request.method, request.url, identifier=cache_identifier)
+
+        prepared = self.session.prepare_request(request)
+        return cache.get_request_hash(
+            prepared.method or request.method,
+            prepared.url or request.url,
+            body=prepared.body,
+            headers=prepared.headers,
+            identifier=cache_identifier,
+        )
+
+    @staticmethod
+    def _has_streamed_body(request: requests.Request) -> bool:
+        # file objects, generators and uploaded files can only be read once, so such requests are neither cached nor coalesced
+        if request.files:
+            return True
+        data = request.data
+        return bool(data) and not isinstance(data, (str, bytes, bytearray, dict, list, tuple))
+
+    def _adopt_legacy_entry(self, request: requests.Request, cache: c.Cache, url_hash: str, cache_identifier: str = "") -> bool:
+        # older versions keyed requests only by url, those entries are moved to the new key when they are used the first time
+        if not cache.is_enabled or request.method != "GET":
+            return False
+        return cache.adopt_legacy_entry(cache.get_hash(request.url, cache_identifier), url_hash)
+
+
+class Connection(BaseConnection):
+    """Initialize a Connection with request and caching configuration.
+
+    Args:
+        session: Existing requests Session to use (creates new if None).  
+        headers: Default headers to add to all requests.
+
+        request_delay: Base delay between requests to the same host in seconds.
+        max_retries: Maximum number of retry attempts for failed requests.
+        additional_delay_per_try: Delay before the first retry, it grows exponentially with every further retry.
+        retry_policy: Decides if and after how long failed requests are retried (defaults to one built from additional_delay_per_try).
+        rate_limiter: Decides how long to wait before each request (defaults to a per host limiter using request_delay).
+        adaptive_rate_limit: Learn the rate every host allows from rate limited responses, starting at request_delay (ignored if rate_limiter is passed).
+        metrics: Collects timings and counters of the requests and calls hooks for them (nothing is measured if None).
+        pool_connections: Number of hosts the session keeps a connection pool for (the session is left as it is if None).
+        pool_maxsize: Number of keep alive connections pooled per host, should be at least the number of threads sending requests.
+        pool_block: Wait for a free pooled connection instead of opening one that is thrown away afterwards.
+        
+        error_status_codes: HTTP status codes that trigger immediate failure.
+        warning_status_codes: HTTP status code that trigger immediate failure but won't raise an error
+        rate_limit_status_codes: HTTP status codes that trigger retries.
+
+        cache_enabled: Whether response caching is enabled.
+        cache_directory: Directory path for cached responses.
+        cache_expires_after: Duration before cached responses expire.
+        cache_memory_entries: Number of responses kept in the in memory cache tier, 0 disables it.
+        cache_memory_bytes: Maximum total body size of the in memory cache tier.
+        cache_respect_cache_control: Use max-age and stale-while-revalidate of responses instead of cache_expires_after.
+        cache_max_size: Bytes the cache may take up on disk before least recently used entries are evicted, 0 means unlimited.
+        cache_compression: Codec for cached bodies: none, zlib, lzma, zstd (if installed) or auto.
+        cache_compression_min_size: Bodies smaller than this are stored uncompressed.
+        cache_vary_headers: Request headers that are part of the cache key.
+        cache_write_behind: Write responses to the cache in a background thread, call `connection.cache.flush()` to wait for them.
+        cache_error_expires_after: Duration error responses are cached for, they still raise when served from the cache (0 doesn't cache them).
+        cache_stale_if_error: Duration expired responses are kept and served instead of raising when the server fails.
+    """
+            
+    def __init__(
+        self, 
+
+        session: Optional[requests.Session] = None,
+        headers: Optional[dict] = None,
+
+        request_delay: float = 0,
+        max_retries: Optional[int] = 5,
+        additional_delay_per_try: float = 1,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        adaptive_rate_limit: bool = False,
+        metrics: Optional[Metrics] = None,
+
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        pool_block: Optional[bool] = None,
+
+        error_status_codes: Optional[Set[int]] = None,
+        warning_status_codes: Optional[Set[int]] = None,
+        rate_limit_status_codes: Optional[Set[int]] = None,
+        
+        cache_enabled: Optional[bool] = None,
+        cache_directory: Optional[str] = None,
+        cache_expires_after: Optional[timedelta] = None,
+        cache_memory_entries: Optional[int] = None,
+        cache_memory_bytes: Optional[int] = None,
+        cache_respect_cache_control: Optional[bool] = None,
+        cache_max_size: Optional[int] = None,
+        cache_compression: Optional[str] = None,
+        cache_compression_min_size: Optional[int] = None,
+        cache_vary_headers: Optional[Tuple[str, ...]] = None,
+        cache_write_behind: Optional[bool] = None,
+        cache_error_expires_after: Optional[timedelta] = None,
+        cache_stale_if_error: Optional[timedelta] = None,
+    ) -> None:
+        new_kwargs = locals()
+        new_kwargs.pop("self")
+        new_kwargs.pop("pool_connections")
+        new_kwargs.pop("pool_maxsize")
+        new_kwargs.pop("pool_block")
+        new_kwargs.pop("__class__", None)
+        super().__init__(**new_kwargs)
+
+        # coalesces identical requests that are in flight at the same time
+        self.single_flight = SingleFlight()
+        # segmented downloads don't split files into parts smaller than this
+        self.segment_min_size = 1024 * 1024
+
+        if pool_connections is not None or pool_maxsize is not None or pool_block is not None:
+            self.configure_pools(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+
+    def _get_adapters(self) -> List[HTTPAdapter]:
+        adapters: List[HTTPAdapter] = []
+        for adapter in self.session.adapters.values():
+            if isinstance(adapter, HTTPAdapter) and not any(adapter is known for known in adapters):
+                adapters.append(adapter)
+        return adapters
+
+    def configure_pools(
+        self, 
+        pool_connections: Optional[int] = None, 
+        pool_maxsize: Optional[int] = None, 
+        pool_block: Optional[bool] = None,
+    ):
+        """
+        Resizes the connection pools of the HTTPAdapters mounted on the session.
+        The adapters are reconfigured instead of replaced, so custom ones (like the one of cloudscraper) keep their TLS setup.
+        Values that are None stay as they are.
+
+        Args:
+            pool_connections: Number of hosts a connection pool is kept for.
+            pool_maxsize: Number of keep alive connections pooled per host.
+            pool_block: Wait for a free pooled connection instead of opening one that is thrown away afterwards.
+        """
+        adapters = self._get_adapters()
+        if not adapters:
+            adapters = [HTTPAdapter()]
+            self.session.mount("https://", adapters[0])
+            self.session.mount("http://", adapters[0])
+
+        for adapter in adapters:
+            connections = adapter._pool_connections if pool_connections is None else pool_connections
+            maxsize = adapter._pool_maxsize if pool_maxsize is None else pool_maxsize
+            block = adapter._pool_block if pool_block is None else pool_block
+            logger.debug("pooling %s connections for %s hosts (block=%s) in %s", maxsize, connections, block, type(adapter).__name__)
+
+            adapter._pool_connections = connections
+            adapter._pool_maxsize = maxsize
+            adapter._pool_block = block
+            adapter.poolmanager.clear()
+            adapter.init_poolmanager(connections, maxsize, block=block)
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """
+        Counts how many requests reused a pooled connection instead of opening a new one, which also means a new TLS handshake.
+        Only hosts whose pool is still kept by the session are counted, see pool_connections.
+
+        Returns:
+            dict: The totals of `requests`, `connections` (newly opened), `reused` and `reuse_rate`, and the same counters per host in `hosts`.
+        """
+        hosts: Dict[str, Dict[str, int]] = {}
+        for adapter in self._get_adapters():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+
+                stats = hosts.setdefault(f"{pool.scheme}://{pool.host}:{pool.port}", {"requests": 0, "connections": 0})
+                stats["requests"] += pool.num_requests
+                stats["connections"] += pool.num_connections
+
+        for stats in hosts.values():
+            stats["reused"] = max(0, stats["requests"] - stats["connections"])
+
+        total_requests = sum(stats["requests"] for stats in hosts.values())
+        total_connections = sum(stats["connections"] for stats in hosts.values())
+        reused = sum(stats["reused"] for stats in hosts.values())
+        return {
+            "requests": total_requests,
+            "connections": total_connections,
+            "reused": reused,
+            "reuse_rate": reused / total_requests if total_requests > 0 else 0.0,
+            "hosts": hosts,
+        }
+
+    def _send_request(self, request: requests.Request, cache: Optional[c.Cache] = None, **kwargs) -> requests.Response:
         url = request.url 
         if url is None:
             raise ValueError("can't send a request without url")
 
         cache = self.cache.fork(**kwargs) if cache is None else cache
-        url_hash = cache.get_hash(url, kwargs.get("cache_identifier", ""))
+        is_streamed = self._has_streamed_body(request)
+        if is_streamed and cache.is_enabled:
+            # the body isn't part of the cache key, so the response can't be cached
+            cache = cache.fork(cache_enabled=False)
+        url_hash = self.get_request_hash(request, cache=cache, cache_identifier=kwargs.get("cache_identifier", ""))
 
         if kwargs.get("referer") is not None:
-            request.headers["Referer"] = kwargs.get("Referer")
+            request.headers["Referer"] = kwargs.get("referer")
+
+        # identical requests that are in flight at the same time are only sent once, the others wait for the result
+        if request.method in self.coalesce_methods and not is_streamed and not kwargs.get("stream") and not kwargs.get("coalesced"):
+            response, is_leader = self.single_flight.do(
+                (request.method, url_hash),
+                lambda: self._send_request(request, cache=cache, coalesced=True, **kwargs),
+            )
+            if is_leader or response is None:
+                return response
+            if cache.is_enabled and cache.has_cache(url_hash):
+                return self._get_cached(cache, url_hash)
+            return copy.copy(response)
 
         max_retries = kwargs.get("max_retries")
         if max_retries is None:
@@ -171,58 +471,133 @@ class Connection:
                 "\tmethod        = %s\n"
                 "\turl           = %s\n"
                 "\tcache_enabled = %s\n"
-                "\tattempt       = %s/%s\n"
+                "\tmax_retries   = %s\n"
             ),
             url_hash,
             request.method,
             url,
             cache.is_enabled,
-            attempt, max_retries,
+            max_retries,
         )
 
-        if cache.has_cache(url_hash):
+        metrics = self.metrics
+        if metrics is not None:
+            lookup_started = time.perf_counter()
+
+        is_cached = cache.has_cache(url_hash) or self._adopt_legacy_entry(request, cache, url_hash, kwargs.get("cache_identifier", ""))
+        if metrics is not None and cache.is_enabled:
+            metrics.observe("cache_lookup", url, time.perf_counter() - lookup_started)
+            metrics.count("cache_hits" if is_cached else "cache_misses", url)
+        if is_cached:
+            return self._get_cached(cache, url_hash)
+
+        # an expired entry can be revalidated with a conditional request instead of downloading it again
+        validators, serve_stale = cache.get_revalidation(url_hash) if cache.is_enabled else ({}, False)
+        if serve_stale and not kwargs.get("revalidating"):
+            logger.info("%s - serving stale cache while revalidating", url_hash)
+            self._revalidate_in_background(request, cache, url_hash, **kwargs)
             return cache.get_cache(url_hash)
+        if validators:
+            request.headers = {**request.headers, **validators}
         
         # all stuff that can be done before sending the request should be done here to minimize the possible time waiting
         prepared = self.session.prepare_request(request)
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug("headers for %s\n%s", url_hash, json.dumps(dict(prepared.headers), indent=4))
-        
-        current_delay = self.request_delay + (self.additional_delay_per_try * attempt)
-        elapsed_time = time.time() - self.last_request
-        to_wait = current_delay - elapsed_time
 
-        if to_wait > 0:
-            logger.debug("waiting for %.3f seconds", to_wait)
-            time.sleep(to_wait)
+        started = time.monotonic()
+        attempt = 0
+        retry_delay = 0.0
+        while True:
+            if retry_delay > 0:
+                logger.debug("waiting for %.3f seconds before retry %s/%s", retry_delay, attempt, max_retries)
+                time.sleep(retry_delay)
 
-        self.last_request = time.time()
-        
-        try:
-            response = self.session.send(prepared)
-        except requests.ConnectionError:
-            if max_retries is not None and max_retries <= attempt:
-                raise
-            return self._send_request(request, attempt=attempt+1, cache=cache, **kwargs)
-        
-        if response.status_code in self.warning_status_codes:
-            logger.warning("server returned error status code %s %s", response.status_code, response.reason)
-            return response
+            waited = self.rate_limiter.acquire(url)
+            if metrics is not None:
+                metrics.observe("rate_limit_wait", url, waited)
+                metrics.count("requests", url)
+                request_started = time.perf_counter()
+            
+            try:
+                response = self.session.send(prepared, stream=kwargs.get("stream", False))
+            except self.retry_policy.retry_exceptions as e:
+                if metrics is not None:
+                    metrics.count("errors", url)
+                retry_delay = self.retry_policy.get_delay(attempt)
+                if not self.retry_policy.should_retry(attempt, max_retries, time.monotonic() - started, retry_delay):
+                    return self._handle_failure(e, cache, url_hash)
+                logger.warning("%s failed (%s), retrying", url, e)
+                if metrics is not None:
+                    metrics.count("retries", url)
+                attempt += 1
+                continue
+
+            self.rate_limiter.on_response(url, response.status_code in self.rate_limit_status_codes)
+            if metrics is not None:
+                metrics.observe("request", url, time.perf_counter() - request_started)
+                if response.status_code in self.rate_limit_status_codes:
+                    metrics.count("rate_limited", url)
+
+            if response.status_code == 304 and validators:
+                return cache.refresh_cache(url_hash, response)
+            
+            if response.status_code in self.warning_status_codes:
+                logger.warning("server returned error status code %s %s", response.status_code, response.reason)
+                if cache.is_enabled and cache.error_expires_after > timedelta(0):
+                    cache.write_cache(url_hash, response)
+                return response
 
-        if not self.validate_response(response):
-            if max_retries is not None and max_retries <= attempt:
-                raise requests.HTTPError(
-                    f"Max retries exceeded, server is rate limiting {response.status_code}: {response.reason}",
-                    response=response
-                )
-            return self._send_request(request, attempt=attempt+1, cache=cache, **kwargs)
+            # retry status codes are retried even if they are error status codes as well, like 502 and 503 by default
+            should_retry = response.status_code in self.retry_policy.retry_status_codes
+            try:
+                is_valid = should_retry or self.validate_response(response)
+            except requests.HTTPError as e:
+                return self._handle_failure(e, cache, url_hash)
+
+            if should_retry or not is_valid:
+                retry_delay = self.retry_policy.get_delay(attempt, response)
+                if not self.retry_policy.should_retry(attempt, max_retries, time.monotonic() - started, retry_delay):
+                    return self._handle_failure(requests.HTTPError(
+                        f"Max retries exceeded, server returned status code {response.status_code}: {response.reason}",
+                        response=response
+                    ), cache, url_hash)
+                logger.warning("server returned status code %s %s, retrying", response.status_code, response.reason)
+                if metrics is not None:
+                    metrics.count("retries", url)
+                response.close()
+                attempt += 1
+                continue
+
+            break
 
         if cache.is_enabled:
+            if metrics is not None:
+                write_started = time.perf_counter()
             cache.write_cache(url_hash, response)
+            if metrics is not None:
+                metrics.observe("cache_write", url, time.perf_counter() - write_started)
         
         return response
     
 
+    def _revalidate_in_background(self, request: requests.Request, cache: c.Cache, url_hash: str, **kwargs):
+        with self._revalidating_lock:
+            if url_hash in self._revalidating:
+                return
+            self._revalidating.add(url_hash)
+
+        def revalidate():
+            try:
+                self._send_request(request, cache=cache, revalidating=True, **kwargs)
+            except requests.exceptions.RequestException as e:
+                logger.warning("revalidating %s failed: %s", request.url, e)
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(url_hash)
+
+        threading.Thread(target=revalidate, daemon=True).start()
+
     def send_request(
         self, 
         request: requests.Request, 
@@ -343,6 +718,411 @@ class Connection:
             **({} if request_kwargs is None else request_kwargs),
         ), **new_kwargs)
 
+    def get_many(
+        self, 
+        urls: Iterable[str], 
+        max_workers: int = 8,
+        ordered: bool = False,
+        **kwargs,
+    ) -> Iterator[Tuple[str, Optional[requests.Response]]]:
+        """Send GET requests for many urls concurrently on a thread pool.
+
+        Cached urls are looked up in one go and returned right away without taking a worker.
+        Delays, retries and caching work the same as with `get`.
+
+        Args:
+            urls: Target URLs for the requests.
+            max_workers: Number of requests that are sent at the same time.
+            ordered: Yield the results in the order of `urls` instead of the order they complete.
+            **kwargs: Arguments passed to every `get` call.
+        Yields:
+            Tuple[str, requests.Response]: The url and the server's response.
+        """
+
+        urls = list(urls)
+        cache = self.cache.fork(**kwargs)
+        url_hashes = [
+            self.get_request_hash(
+                requests.Request(
+                    'GET', 
+                    url=url, 
+                    headers=kwargs.get("headers"), 
+                    **(kwargs.get("request_kwargs") or {})
+                ), 
+                cache=cache, 
+                cache_identifier=kwargs.get("cache_identifier", ""),
+            )
+            for url in urls
+        ]
+        cached = cache.has_cache_many(url_hashes)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures: List[Optional[Future]] = [
+                None if url_hash in cached else executor.submit(self.get, url, **kwargs)
+                for url, url_hash in zip(urls, url_hashes)
+            ]
+
+            if ordered:
+                for url, url_hash, future in zip(urls, url_hashes, futures):
+                    yield url, self._get_cached(cache, url_hash) if future is None else future.result()
+                return
+
+            url_by_future = {}
+            for url, url_hash, future in zip(urls, url_hashes, futures):
+                if future is None:
+                    yield url, self._get_cached(cache, url_hash)
+                else:
+                    url_by_future[future] = url
+
+            for future in as_completed(url_by_future):
+                yield url_by_future[future], future.result()
+        finally:
+            # if the caller stops iterating early, the requests that didn't start yet are dropped
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def crawl(
+        self,
+        urls: Iterable[Union[str, Tuple[str, int]]],
+        max_workers: int = 8,
+        max_per_host: int = 1,
+        **kwargs,
+    ) -> Iterator[Tuple[str, Optional[requests.Response]]]:
+        """Send GET requests for urls of many hosts, interleaving the hosts so no time is spent waiting on one while others are idle.
+
+        Unlike `get_many` every host gets its own queue and is only requested once its rate limiter allows it, see `Scheduler`.
+
+        Args:
+            urls: Target URLs or (url, priority) tuples, higher priorities are sent first. Can be an endless generator.
+            max_workers: Number of requests that are sent at the same time.
+            max_per_host: Number of requests to the same host that are in flight at the same time.
+            **kwargs: Arguments passed to every `get` call.
+        Yields:
+            Tuple[str, requests.Response]: The url and the server's response, in the order they complete.
+        """
+
+        return Scheduler(self, max_workers=max_workers, max_per_host=max_per_host, **kwargs).run(urls)
+
+    def download(
+        self, 
+        url: str, 
+        path: Union[str, Path],
+        headers: Optional[dict] = None, 
+        request_kwargs: Optional[dict] = None,
+        chunk_size: int = 1024 * 1024,
+        max_resumes: Optional[int] = 5,
+        segments: int = 1,
+
+        max_retries: Optional[int] = None,
+        cache_identifier: str = "", 
+        referer: Optional[str] = None,
+
+        cache_enabled: Optional[bool] = None,
+        cache_directory: Optional[str] = None,
+        cache_expires_after: Optional[timedelta] = None,
+        **kwargs,
+    ):
+        """Stream a GET request into a file without holding the body in memory.
+        
+        If the connection drops mid download, it is resumed with a `Range` request where the server supports it,
+        and restarted if the ETag or Last-Modified date of the file changed meanwhile.
+        If caching is enabled, the finished file is streamed into the cache as well.
+
+        With `segments` above 1 and a server that supports ranges, the file is split into that many byte ranges that are downloaded 
+        at the same time into a preallocated file. The progress is kept in `<path>.segments`, so if the download fails, 
+        calling it again only downloads the missing parts, as long as the length and ETag of the file didn't change.
+
+        Args:
+            url: Target URL for the request.
+            path: File the body is written to.
+            headers: Additional headers for this request.
+            request_kwargs: Additional arguments for Request constructor.
+            chunk_size: Number of bytes read and written at once.
+            max_resumes: Maximum number of times a dropped download is resumed.
+            segments: Number of byte ranges downloaded at the same time.
+            max_retries: Override default max retry attempts.
+            cache_identifier: Additional key for cache differentiation.
+            referer: Referer header to set for this request.
+            cache_enabled: Temporarily enable/disable caching.
+            cache_directory: Alternate cache location for this request.
+            cache_expires_after: Custom cache expiration for this request.
+        Returns:
+            requests.Response: The server's response, its body was already consumed into `path`.
+        """
+
+        new_kwargs = locals()
+        new_kwargs.pop("self")
+        new_kwargs.update(new_kwargs.pop("kwargs"))
+        new_kwargs.pop("stream", None)
+
+        path = Path(path)
+        cache = self.cache.fork(**new_kwargs)
+        cache_request = requests.Request(
+            'GET',
+            url=url,
+            headers=headers,
+            **({} if request_kwargs is None else request_kwargs)
+        )
+        url_hash = self.get_request_hash(cache_request, cache=cache, cache_identifier=cache_identifier)
+
+        if cache.has_cache(url_hash) or self._adopt_legacy_entry(cache_request, cache, url_hash, cache_identifier):
+            response = self._get_cached(cache, url_hash)
+            if response is None:
+                return None
+            with path.open("wb") as f:
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+            return response
+
+        # the body is streamed, so the request itself must never be written to the cache
+        no_cache = cache.fork(cache_enabled=False)
+
+        if segments > 1:
+            # a one byte range tells if the server supports ranges, and how long the file is
+            probe_headers = {} if headers is None else dict(headers)
+            probe_headers["Range"] = "bytes=0-0"
+            probe = self._send_request(requests.Request(
+                'GET',
+                url=url,
+                headers=probe_headers,
+                **({} if request_kwargs is None else request_kwargs)
+            ), cache=no_cache, stream=True, **new_kwargs)
+            if probe is None:
+                return None
+
+            content_range = _parse_content_range(probe.headers.get("Content-Range")) if probe.status_code == 206 else None
+            size = None if content_range is None else content_range[2]
+            if size is not None and size >= 2 * self.segment_min_size:
+                for _ in probe.iter_content(chunk_size):
+                    pass
+                response = self._download_segments(url, path, probe, size, segments, headers, request_kwargs, chunk_size, max_resumes, no_cache, new_kwargs)
+
+                if cache.is_enabled:
+                    with path.open("rb") as f:
+                        cache.write_cache(url_hash, response, body=f)
+                return response
+
+            probe.close()
+            if size is None:
+                logger.info("%s doesn't support ranges, downloading it in one piece", url)
+
+        first_response: Optional[requests.Response] = None
+        # etag or last modified date of the first response, so a resumed download doesn't stitch together two versions of the file
+        validator: Optional[str] = None
+        written = 0
+        resumes = 0
+
+        with path.open("wb") as f:
+            while True:
+                request_headers = {} if headers is None else dict(headers)
+                if written > 0:
+                    request_headers["Range"] = f"bytes={written}-"
+                    if validator is not None:
+                        # if the file changed meanwhile the server sends all of it instead of the rest
+                        request_headers["If-Range"] = validator
+
+                response = self._send_request(requests.Request(
+                    'GET',
+                    url=url,
+                    headers=request_headers,
+                    **({} if request_kwargs is None else request_kwargs)
+                ), cache=no_cache, stream=True, **new_kwargs)
+                if response is None:
+                    return None
+
+                if written > 0 and response.status_code == 206:
+                    content_range = _parse_content_range(response.headers.get("Content-Range"))
+                    first_etag = first_response.headers.get("ETag") if first_response is not None else None
+                    if content_range is None or content_range[0] != written or response.headers.get("ETag") not in (None, first_etag):
+                        logger.info("%s changed or sent the wrong range, restarting download", url)
+                        response.close()
+                        f.seek(0)
+                        f.truncate()
+                        written = 0
+                        continue
+                elif written > 0:
+                    logger.info("%s doesn't support ranges or changed, restarting download", url)
+                    f.seek(0)
+                    f.truncate()
+                    written = 0
+                if written == 0:
+                    first_response = response
+                    etag = response.headers.get("ETag")
+                    # weak etags don't guarantee identical bytes, so they can't be used to stitch ranges together
+                    validator = etag if etag is not None and not etag.startswith("W/") else response.headers.get("Last-Modified")
+
+                try:
+                    for chunk in response.iter_content(chunk_size):
+                        f.write(chunk)
+                        written += len(chunk)
+                    break
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                    if max_resumes is not None and resumes >= max_resumes:
+                        raise
+                    resumes += 1
+                    logger.warning("connection dropped after %s bytes, resuming download of %s", written, url)
+                finally:
+                    response.close()
+
+        if cache.is_enabled and first_response is not None:
+            with path.open("rb") as f:
+                cache.write_cache(url_hash, first_response, body=f)
+
+        return response
+
+    def _download_segments(
+        self,
+        url: str,
+        path: Path,
+        probe: requests.Response,
+        size: int,
+        segments: int,
+        headers: Optional[dict],
+        request_kwargs: Optional[dict],
+        chunk_size: int,
+        max_resumes: Optional[int],
+        cache: c.Cache,
+        kwargs: Dict[str, Any],
+    ) -> requests.Response:
+        etag = probe.headers.get("ETag")
+        # weak etags don't guarantee identical bytes, so they can't be used to stitch ranges together
+        if etag is not None and etag.startswith("W/"):
+            etag = None
+        last_modified = probe.headers.get("Last-Modified")
+        state_file = path.with_name(f"{path.name}.segments")
+
+        # [start, end, written] of every byte range, end is inclusive like in the Range header
+        state = self._load_segments(state_file, url, size, etag, last_modified) if path.exists() else None
+        if state is None:
+            segments = min(segments, size // self.segment_min_size)
+            length = -(-size // segments)
+            state = {
+                "url": url,
+                "size": size,
+                "etag": etag,
+                "last_modified": last_modified,
+                "segments": [[start, min(size, start + length) - 1, 0] for start in range(0, size, length)],
+            }
+        else:
+            missing = sum(end - start + 1 - written for start, end, written in state["segments"])
+            logger.info("resuming download of %s, %s of %s bytes are missing", url, missing, size)
+
+        lock = threading.Lock()
+        stop = threading.Event()
+        resumes = 0
+        last_save = time.monotonic()
+
+        def save():
+            nonlocal last_save
+            last_save = time.monotonic()
+            temp_file = state_file.with_name(f"{state_file.name}.{threading.get_ident()}.tmp")
+            temp_file.write_text(json.dumps(state))
+            os.replace(temp_file, state_file)
+
+        def download_segment(segment: List[int]):
+            nonlocal resumes
+            start, end = segment[0], segment[1]
+
+            while segment[2] < end - start + 1 and not stop.is_set():
+                offset = start + segment[2]
+                request_headers = {} if headers is None else dict(headers)
+                request_headers["Range"] = f"bytes={offset}-{end}"
+                if etag is not None or last_modified is not None:
+                    # if the file changed meanwhile the server sends all of it instead of the range
+                    request_headers["If-Range"] = etag if etag is not None else last_modified
+
+                response = self._send_request(requests.Request(
+                    'GET',
+                    url=url,
+                    headers=request_headers,
+                    **({} if request_kwargs is None else request_kwargs)
+                ), cache=cache, stream=True, **kwargs)
+                if response is None:
+                    raise requests.ConnectionError(f"downloading bytes {offset}-{end} of {url} failed")
+
+                try:
+                    if response.status_code != 206 or _parse_content_range(response.headers.get("Content-Range")) != (offset, end, size):
+                        raise requests.HTTPError(f"{url} changed while downloading, expected bytes {offset}-{end}/{size}", response=response)
+                    if etag is not None and response.headers.get("ETag") not in (None, etag):
+                        raise requests.HTTPError(f"{url} changed while downloading, the ETag isn't {etag} anymore", response=response)
+                    if last_modified is not None and response.headers.get("Last-Modified") not in (None, last_modified):
+                        raise requests.HTTPError(f"{url} changed while downloading, it was modified after {last_modified}", response=response)
+
+                    for chunk in response.iter_content(chunk_size):
+                        _write_at(fd, chunk, start + segment[2], lock)
+                        with lock:
+                            segment[2] += len(chunk)
+                            if time.monotonic() - last_save > 1:
+                                save()
+                        if stop.is_set():
+                            return
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                    with lock:
+                        if max_resumes is not None and resumes >= max_resumes:
+                            raise
+                        resumes += 1
+                    logger.warning("connection dropped after %s bytes of bytes %s-%s, resuming download of %s", segment[2], start, end, url)
+                finally:
+                    response.close()
+
+        # the file is allocated up front, so every segment writes into its own part of it
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+                if hasattr(os, "posix_fallocate"):
+                    try:
+                        os.posix_fallocate(fd, 0, size)
+                    except OSError as e:
+                        if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                            raise
+            save()
+
+            pending = [segment for segment in state["segments"] if segment[2] < segment[1] - segment[0] + 1]
+            with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+                futures = [executor.submit(download_segment, segment) for segment in pending]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # the other segments stop after their current chunk, their progress is kept for the next try
+                    stop.set()
+                    raise
+                finally:
+                    for future in futures:
+                        future.exception()
+                    with lock:
+                        save()
+
+            if os.fstat(fd).st_size != size or any(written != end - start + 1 for start, end, written in state["segments"]):
+                raise requests.exceptions.ContentDecodingError(f"downloading {url} ended incomplete, download it again to resume")
+        finally:
+            os.close(fd)
+
+        state_file.unlink(missing_ok=True)
+
+        # the probe stands in for the whole file
+        probe.status_code = 200
+        probe.reason = "OK"
+        probe.headers.pop("Content-Range", None)
+        probe.headers["Content-Length"] = str(size)
+        return probe
+
+    def _load_segments(self, state_file: Path, url: str, size: int, etag: Optional[str], last_modified: Optional[str]) -> Optional[Dict[str, Any]]:
+        # the progress of an earlier download is only used if it is provably of the same file
+        try:
+            state = json.loads(state_file.read_text())
+        except (OSError, ValueError):
+            return None
+
+        if etag is None and last_modified is None:
+            logger.info("%s has neither an ETag nor Last-Modified, restarting download", url)
+            return None
+        if state.get("url") != url or state.get("size") != size or state.get("etag") != etag or state.get("last_modified") != last_modified:
+            logger.info("%s changed since the last try, restarting download", url)
+            return None
+        return state
+
 
 class SilentConnection(Connection):
     """Initialize a Connection with request and caching configuration.  
@@ -351,8 +1131,15 @@ class SilentConnection(Connection):
     Args:
         session: Existing requests Session to use (creates new if None).  
         headers: Default headers to add to all requests.
-        request_delay: Base delay between requests in seconds.
-        additional_delay_per_try: Extra delay added per retry attempt.
+        request_delay: Base delay between requests to the same host in seconds.
+        additional_delay_per_try: Delay before the first retry, it grows exponentially with every further retry.
+        retry_policy: Decides if and after how long failed requests are retried (defaults to one built from additional_delay_per_try).
+        rate_limiter: Decides how long to wait before each request (defaults to a per host limiter using request_delay).
+        adaptive_rate_limit: Learn the rate every host allows from rate limited responses, starting at request_delay (ignored if rate_limiter is passed).
+        metrics: Collects timings and counters of the requests and calls hooks for them (nothing is measured if None).
+        pool_connections: Number of hosts the session keeps a connection pool for (the session is left as it is if None).
+        pool_maxsize: Number of keep alive connections pooled per host, should be at least the number of threads sending requests.
+        pool_block: Wait for a free pooled connection instead of opening one that is thrown away afterwards.
         error_status_codes: HTTP status codes that trigger immediate failure.
         rate_limit_status_codes: HTTP status codes that trigger retries.
         max_retries: Maximum number of retry attempts for failed requests.
@@ -367,4 +1154,19 @@ class SilentConnection(Connection):
         except requests.exceptions.RequestException as e:
             logger.warning(e)
             return None
+
+    def download(self, *args, **kwargs) -> Optional[requests.Response]:
+        try:
+            return super().download(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            logger.warning(e)
+            return None
+
+    def _get_cached(self, *args, **kwargs) -> Optional[requests.Response]:
+        # cached error responses are served outside of _send_request by get_many
+        try:
+            return super()._get_cached(*args, **kwargs)
+        except requests.exceptions.RequestException as e:
+            logger.warning(e)
+            return None
         
\ No newline at end of file
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import copy
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Tuple
+
+if TYPE_CHECKING:
+    import requests
+
+
+class MemoryCache:
+    """An in process LRU cache of responses, that sits in front of the disk cache.
+
+    Args:
+        max_entries: Maximum number of responses that are kept.
+        max_bytes: Maximum sum of the body sizes of all kept responses.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: OrderedDict[str, Tuple[datetime, requests.Response, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_valid(self, url_hash: str) -> Optional[requests.Response]:
+        entry = self._entries.get(url_hash)
+        if entry is None:
+            return None
+
+        expires_at, response, _ = entry
+        if datetime.now() > expires_at:
+            self._remove(url_hash)
+            return None
+
+        self._entries.move_to_end(url_hash)
+        return response
+
+    def contains(self, url_hash: str) -> bool:
+        with self._lock:
+            found = self._get_valid(url_hash) is not None
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found
+
+    def get(self, url_hash: str) -> Optional[requests.Response]:
+        with self._lock:
+            response = self._get_valid(url_hash)
+
+        # a shallow copy, so callers changing attributes of their response don't affect the cached one
+        return None if response is None else copy.copy(response)
+
+    def put(self, url_hash: str, response: requests.Response, expires_at: datetime):
+        # reading the content here means iter_content of the copies only slices the bytes instead of reading a shared stream
+        size = len(response.content)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._remove(url_hash)
+            self._entries[url_hash] = (expires_at, response, size)
+            self.size += size
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, url_hash: str):
+        entry = self._entries.pop(url_hash, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def remove(self, url_hash: str):
+        with self._lock:
+            self._remove(url_hash)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+
+# the same default buckets the prometheus client libraries use
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10, 30, 60)
+
+# events that measure a duration in seconds, every other event is a counter
+TIMED_EVENTS: Tuple[str, ...] = ("cache_lookup", "rate_limit_wait", "request", "cache_write")
+COUNTED_EVENTS: Tuple[str, ...] = ("requests", "cache_hits", "cache_misses", "retries", "rate_limited", "errors")
+
+
+class Histogram:
+    """Counts observed values in fixed buckets, like a prometheus histogram."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_quantile(self, quantile: float) -> float:
+        """
+        Estimates a quantile from the buckets, values above the largest bucket are reported as that bucket.
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = quantile * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[min(i, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def cumulative_counts(self) -> List[int]:
+        result = []
+        seen = 0
+        for count in self.counts:
+            seen += count
+            result.append(seen)
+        return result
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """Collects counters and latency histograms per host and calls hooks for every event.
+    A connection without metrics doesn't measure anything, so it costs nothing if it isn't used.
+
+    Events:
+        cache_lookup, rate_limit_wait, request, cache_write: Durations in seconds.
+        requests, cache_hits, cache_misses, retries, rate_limited, errors: Counters, the value is always 1.
+
+    Args:
+        buckets: Upper bounds of the histogram buckets in seconds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+
+        self._hooks: Dict[str, List[Callable[[str, float], Any]]] = defaultdict(list)
+        self._counters: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, event: str, hook: Callable[[str, float], Any]):
+        """
+        Calls `hook(url, value)` every time `event` happens.
+        Hooks run synchronously in the thread sending the request, so they should be fast.
+        """
+        if event not in TIMED_EVENTS and event not in COUNTED_EVENTS:
+            raise ValueError(f"unknown event {event}, available are {', '.join(TIMED_EVENTS + COUNTED_EVENTS)}")
+        self._hooks[event].append(hook)
+
+    def remove_hook(self, event: str, hook: Callable[[str, float], Any]):
+        self._hooks[event].remove(hook)
+
+    def _call_hooks(self, event: str, url: str, value: float):
+        hooks = self._hooks.get(event)
+        if hooks:
+            for hook in hooks:
+                hook(url, value)
+
+    def count(self, event: str, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            self._counters[(event, host)] += 1
+        self._call_hooks(event, url, 1)
+
+    def observe(self, event: str, url: str, seconds: float):
+        host = urlparse(url).netloc
+        with self._lock:
+            histogram = self._histograms.get((event, host))
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self._histograms[(event, host)] = histogram
+            histogram.observe(seconds)
+        self._call_hooks(event, url, seconds)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the collected metrics grouped by host.
+        """
+        result: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        with self._lock:
+            for (event, host), value in sorted(self._counters.items()):
+                result[host][event] = value
+            for (event, host), histogram in sorted(self._histograms.items()):
+                result[host][event + "_seconds"] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.get_quantile(0.5),
+                    "p99": histogram.get_quantile(0.99),
+                    "buckets": dict(zip([str(b) for b in histogram.buckets] + ["+Inf"], histogram.cumulative_counts())),
+                }
+        return dict(result)
+
+    def to_prometheus(self, prefix: str = "easy_requests") -> str:
+        """
+        Returns the collected metrics in the prometheus text exposition format.
+        """
+        lines: List[str] = []
+        with self._lock:
+            counters: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+            for (event, host), value in sorted(self._counters.items()):
+                counters[event].append((host, value))
+            for event, values in counters.items():
+                name = f"{prefix}_{event}_total"
+                lines.append(f"# TYPE {name} counter")
+                for host, value in values:
+                    lines.append(f"{name}{{host=\"{_escape_label(host)}\"}} {value}")
+
+            histograms: Dict[str, List[Tuple[str, Histogram]]] = defaultdict(list)
+            for (event, host), histogram in sorted(self._histograms.items()):
+                histograms[event].append((host, histogram))
+            for event, values in histograms.items():
+                name = f"{prefix}_{event}_seconds"
+                lines.append(f"# TYPE {name} histogram")
+                for host, histogram in values:
+                    label = f"host=\"{_escape_label(host)}\""
+                    bounds = [repr(float(b)) for b in histogram.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, histogram.cumulative_counts()):
+                        lines.append(f"{name}_bucket{{{label},le=\"{bound}\"}} {count}")
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: Union[str, Path], format: str = "prometheus"):
+        """
+        Writes the collected metrics to `path`, either as `"prometheus"` text or as `"json"`.
+        """
+        if format == "prometheus":
+            content = self.to_prometheus()
+        elif format == "json":
+            content = json.dumps(self.to_dict(), indent=4)
+        else:
+            raise ValueError(f"unknown format {format}, available are prometheus, json")
+
+        Path(path).write_text(content)
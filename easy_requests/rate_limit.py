@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+from abc import ABC, abstractmethod
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+from urllib.parse import urlparse
+from weakref import WeakKeyDictionary, WeakSet
+
+import requests
+
+
+logger = logging.getLogger("easy_requests")
+
+
+class TokenBucket:
+    """A thread safe token bucket.
+
+    Args:
+        rate: Tokens added per second, `math.inf` disables limiting.
+        burst: Maximum number of tokens that can be saved up.
+    """
+
+    def __init__(self, rate: float = math.inf, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens: float = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token and returns how many seconds the caller has to wait before using it.
+        The token is taken even if the caller has to wait, so concurrent callers queue up behind each other.
+        """
+        if math.isinf(self.rate):
+            return 0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def get_wait(self) -> float:
+        """
+        Returns how many seconds until a token is available, without taking it.
+        """
+        if math.isinf(self.rate):
+            return 0
+
+        with self._lock:
+            tokens = min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            if tokens >= 1:
+                return 0
+            return (1 - tokens) / self.rate
+
+    def set_rate(self, rate: float):
+        """
+        Changes the rate, the tokens saved up so far are kept.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not math.isinf(self.rate):
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = rate
+
+
+class RateLimiter(ABC):
+    """
+    Decides how long a request has to wait before it is sent.
+    Subclass it and implement `acquire` to plug in your own limiting.
+    """
+
+    @abstractmethod
+    def acquire(self, url: str) -> float:
+        """
+        Blocks until a request to `url` may be sent.
+        Returns the number of seconds that were waited.
+        """
+
+    async def acquire_async(self, url: str) -> float:
+        """
+        Same as `acquire` for asyncio code.
+        By default the blocking `acquire` runs in a worker thread.
+        """
+        return await asyncio.to_thread(self.acquire, url)
+
+    def get_wait(self, url: str) -> float:
+        """
+        Returns how many seconds a request to `url` would have to wait right now, without reserving anything.
+        Schedulers use it to pick the host that may be requested next, by default no request has to wait.
+        """
+        return 0
+
+    def on_response(self, url: str, rate_limited: bool):
+        """
+        Is called with every response, `rate_limited` is True if its status code is one of the rate limit status codes.
+        Limiters that adapt to the server can override it.
+        """
+        pass
+
+
+class HostRateLimiter(RateLimiter):
+    """Rate limits every host with its own token bucket, so a slow host doesn't hold back the others.
+
+    Args:
+        rate: Default requests per second for every host, `math.inf` disables limiting.
+        burst: Default number of requests that can be sent at once after being idle.
+    """
+
+    def __init__(self, rate: float = math.inf, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_delay(cls, request_delay: float, burst: float = 1) -> HostRateLimiter:
+        """Creates a limiter that waits `request_delay` seconds between requests to the same host."""
+        return cls(rate=math.inf if request_delay <= 0 else 1 / request_delay, burst=burst)
+
+    @classmethod
+    def for_session(cls, session: requests.Session, request_delay: float = 0, burst: float = 1) -> HostRateLimiter:
+        """
+        Returns the limiter shared by every connection using `session`.
+        It is created with `request_delay` and `burst` the first time.
+        """
+        with _session_limiters_lock:
+            limiter = _session_limiters.get(session)
+            if limiter is None:
+                limiter = cls.from_delay(request_delay, burst=burst)
+                _session_limiters[session] = limiter
+        return limiter
+
+    def set_limit(self, host: str, rate: float, burst: float = 1):
+        """Overrides the rate and burst of a single host."""
+        with self._lock:
+            self._buckets[host] = TokenBucket(rate=rate, burst=burst)
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is not None:
+            return bucket
+
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(rate=self.rate, burst=self.burst)
+                self._buckets[host] = bucket
+        return bucket
+
+    def acquire(self, url: str) -> float:
+        host = urlparse(url).netloc
+        to_wait = self.get_bucket(host).reserve()
+
+        if to_wait > 0:
+            logger.debug("waiting for %.3f seconds for %s", to_wait, host)
+            time.sleep(to_wait)
+        return to_wait
+
+    def get_wait(self, url: str) -> float:
+        return self.get_bucket(urlparse(url).netloc).get_wait()
+
+    async def acquire_async(self, url: str) -> float:
+        host = urlparse(url).netloc
+        to_wait = self.get_bucket(host).reserve()
+
+        if to_wait > 0:
+            logger.debug("waiting for %.3f seconds for %s", to_wait, host)
+            await asyncio.sleep(to_wait)
+        return to_wait
+
+
+class AdaptiveRateLimiter(HostRateLimiter):
+    """Learns the rate every host allows, by raising it additively while requests succeed and cutting it multiplicatively when they are rate limited (AIMD).
+
+    Args:
+        rate: Requests per second a host starts with before anything was learned.
+        min_rate: The rate is never cut below this.
+        max_rate: The rate is never raised above this.
+        increase: Requests per second added after every successful response.
+        decrease: Factor the rate is multiplied with after a rate limited response.
+        burst: Number of requests that can be sent at once after being idle.
+        state_file: Json file the learned rates are loaded from and saved to, so the next run starts near the right speed.
+    """
+
+    def __init__(
+        self,
+        rate: float = 10,
+        min_rate: float = 0.1,
+        max_rate: float = 100,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+        burst: float = 1,
+        state_file: Optional[Union[str, Path]] = None,
+    ):
+        super().__init__(rate=rate, burst=burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+
+        # when the rate of a host was cut the last time
+        self._last_decrease: Dict[str, float] = {}
+
+        self.state_file = None if state_file is None else Path(state_file)
+        if self.state_file is not None:
+            self.load()
+            with _saved_limiters_lock:
+                _saved_limiters.add(self)
+
+    @classmethod
+    def from_delay(cls, request_delay: float, burst: float = 1, **kwargs) -> AdaptiveRateLimiter:
+        """Creates a limiter that starts with waiting `request_delay` seconds between requests to the same host."""
+        if request_delay > 0:
+            kwargs["rate"] = 1 / request_delay
+        return cls(burst=burst, **kwargs)
+
+    @classmethod
+    def for_state_file(cls, state_file: Union[str, Path], request_delay: float = 0, burst: float = 1, **kwargs) -> AdaptiveRateLimiter:
+        """
+        Returns the limiter shared by everything using `state_file`, so limiters don't overwrite each other's rates.
+        It is created with the other arguments the first time.
+        """
+        path = Path(state_file).absolute()
+        with _state_file_limiters_lock:
+            limiter = _state_file_limiters.get(path)
+            if limiter is None:
+                limiter = cls.from_delay(request_delay, burst=burst, state_file=path, **kwargs)
+                _state_file_limiters[path] = limiter
+        return limiter
+
+    def on_response(self, url: str, rate_limited: bool):
+        host = urlparse(url).netloc
+        bucket = self.get_bucket(host)
+
+        if not rate_limited:
+            if bucket.rate < self.max_rate:
+                bucket.set_rate(min(self.max_rate, bucket.rate + self.increase))
+            return
+
+        with self._lock:
+            # responses to requests that were sent before the last cut don't cut again
+            now = time.monotonic()
+            if now - self._last_decrease.get(host, -math.inf) < 1 / bucket.rate:
+                return
+            self._last_decrease[host] = now
+
+        rate = max(self.min_rate, bucket.rate * self.decrease)
+        logger.info("%s is rate limiting, lowering the rate to %.3f requests per second", host, rate)
+        bucket.set_rate(rate)
+        if self.state_file is not None:
+            self.save()
+
+    def get_rates(self) -> Dict[str, float]:
+        """Returns the current rate of every host in requests per second."""
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+    def load(self):
+        """Loads the rates saved in `state_file`, hosts that are configured already are kept."""
+        if self.state_file is None or not self.state_file.exists():
+            return
+
+        try:
+            rates = json.loads(self.state_file.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning("couldn't load the rate limits from %s: %s", self.state_file, e)
+            return
+
+        with self._lock:
+            for host, rate in rates.items():
+                if host not in self._buckets:
+                    self._buckets[host] = TokenBucket(rate=min(self.max_rate, max(self.min_rate, rate)), burst=self.burst)
+
+    def save(self):
+        """Saves the current rates to `state_file`."""
+        if self.state_file is None:
+            return
+
+        rates = self.get_rates()
+        try:
+            # rates of hosts this limiter didn't request are kept
+            rates = {**json.loads(self.state_file.read_text()), **rates}
+        except (OSError, ValueError):
+            pass
+
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.state_file.with_name(f"{self.state_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temp_file.write_text(json.dumps(rates, indent=4))
+        os.replace(temp_file, self.state_file)
+
+
+_session_limiters: WeakKeyDictionary[requests.Session, HostRateLimiter] = WeakKeyDictionary()
+_session_limiters_lock = threading.Lock()
+
+_state_file_limiters: Dict[Path, AdaptiveRateLimiter] = {}
+_state_file_limiters_lock = threading.Lock()
+
+# limiters with a state file, saved by a single exit handler instead of one per limiter
+_saved_limiters: WeakSet[AdaptiveRateLimiter] = WeakSet()
+_saved_limiters_lock = threading.Lock()
+
+
+def _save_limiters():
+    with _saved_limiters_lock:
+        limiters = list(_saved_limiters)
+    for limiter in limiters:
+        try:
+            limiter.save()
+        except OSError as e:
+            logger.warning("couldn't save the rate limits to %s: %s", limiter.state_file, e)
+
+
+atexit.register(_save_limiters)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import math
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Set, Tuple, Type
+
+import requests
+
+
+class RetryPolicy:
+    """Decides if and after how long a failed request is retried.
+
+    Args:
+        backoff_factor: Delay before the first retry in seconds.
+        backoff_multiplier: Factor the delay grows by with every further retry.
+        backoff_max: Upper bound of a single delay in seconds.
+        jitter: Fraction of the delay that is randomized, so clients don't retry in lockstep.
+        respect_retry_after: Wait as long as the `Retry-After` header of the response asks for.
+        max_retry_after: Upper bound of a delay taken from `Retry-After`.
+        total_timeout: Time budget in seconds for a request including all retries, None means no budget.
+        retry_exceptions: Exceptions while sending that trigger a retry.
+        retry_status_codes: Status codes that trigger a retry, in addition to the rate limit status codes of the connection.
+    """
+
+    def __init__(
+        self,
+        backoff_factor: float = 1,
+        backoff_multiplier: float = 2,
+        backoff_max: float = 120,
+        jitter: float = 0.5,
+        respect_retry_after: bool = True,
+        max_retry_after: float = 600,
+        total_timeout: Optional[float] = None,
+        retry_exceptions: Tuple[Type[BaseException], ...] = (requests.ConnectionError, requests.Timeout),
+        retry_status_codes: Optional[Set[int]] = None,
+    ):
+        self.backoff_factor = backoff_factor
+        self.backoff_multiplier = backoff_multiplier
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.total_timeout = total_timeout
+        self.retry_exceptions = retry_exceptions
+        self.retry_status_codes: Set[int] = retry_status_codes if retry_status_codes is not None else set()
+
+    @staticmethod
+    def get_retry_after(response: requests.Response) -> Optional[float]:
+        """
+        Parses the `Retry-After` header, which is either a number of seconds or a http date.
+        """
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def get_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """
+        Seconds to wait before the retry that follows `attempt` (starting at 0).
+        """
+        if self.respect_retry_after and response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+
+        if self.backoff_factor <= 0:
+            return 0.0
+
+        # the exponent stops growing once backoff_max is reached, otherwise endless retries overflow
+        if self.backoff_multiplier > 1 and math.isfinite(self.backoff_max):
+            attempt = min(attempt, math.ceil(math.log(max(1.0, self.backoff_max / self.backoff_factor), self.backoff_multiplier)))
+
+        try:
+            delay = min(self.backoff_max, self.backoff_factor * (float(self.backoff_multiplier) ** attempt))
+        except OverflowError:
+            # without a finite backoff_max the delay grows beyond what a float can hold
+            delay = self.backoff_max
+        return delay * (1 - self.jitter * random.random())
+
+    def should_retry(self, attempt: int, max_retries: Optional[int], elapsed: float, delay: float) -> bool:
+        """
+        If another retry is allowed after `attempt` retries, `elapsed` seconds and before waiting `delay` seconds.
+        """
+        if max_retries is not None and attempt >= max_retries:
+            return False
+        if self.total_timeout is not None and elapsed + delay > self.total_timeout:
+            return False
+        return True
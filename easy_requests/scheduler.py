@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+
+if TYPE_CHECKING:
+    from .cache import Cache
+    from .connections import Connection
+
+
+logger = logging.getLogger("easy_requests")
+
+# a url, or a url and its priority
+CrawlItem = Union[str, Tuple[str, int]]
+
+
+class Scheduler:
+    """Sends GET requests for many urls that mix hosts, always dispatching to whichever host may be requested next.
+
+    A plain loop over `Connection.get` sleeps for the delay of one host while the others sit idle.
+    The scheduler keeps a queue per host instead and asks the rate limiter of the connection when each host may be requested again,
+    so the total time depends on the busiest host instead of the sum of all delays.
+    Urls with a higher priority are sent first, cached urls are returned right away.
+
+    Args:
+        connection: Connection the requests are sent with, its rate limiter decides when a host may be requested.
+        max_workers: Number of requests that are sent at the same time.
+        max_per_host: Number of requests to the same host that are in flight at the same time.
+        max_pending: Number of urls read from the input ahead of time, so endless inputs don't fill up memory.
+        **kwargs: Arguments passed to every `get` call.
+    """
+
+    def __init__(
+        self,
+        connection: Connection,
+        max_workers: int = 8,
+        max_per_host: int = 1,
+        max_pending: int = 10000,
+        **kwargs,
+    ):
+        self.connection = connection
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_pending = max_pending
+        self.kwargs = kwargs
+
+        self._condition = threading.Condition()
+        self._counter = itertools.count()
+        # per host a heap of (-priority, insertion order, url), so higher priorities and then older urls come first
+        self._queues: Dict[str, List[Tuple[int, int, str]]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._results: Deque[Tuple[str, Future]] = deque()
+        self._queued = 0
+        self._running = 0
+        # urls that were added but whose result wasn't handed to the caller yet
+        self._outstanding = 0
+        self._input_done = True
+        self._input_error: Optional[BaseException] = None
+        self._stopped = False
+
+    def add(self, url: str, priority: int = 0):
+        """
+        Queues a url, also while `run` is iterating, e.g. for links found in a response.
+        """
+        host = urlparse(url).netloc
+        with self._condition:
+            heapq.heappush(self._queues.setdefault(host, []), (-priority, next(self._counter), url))
+            self._queued += 1
+            self._outstanding += 1
+            self._condition.notify_all()
+
+    def run(self, urls: Iterable[CrawlItem] = ()) -> Iterator[Tuple[str, Optional[requests.Response]]]:
+        """Sends the requests for `urls` and everything passed to `add`, and yields the responses as they complete.
+
+        `urls` is read lazily in a background thread, so it can be a generator that never ends.
+        The iteration stops once the input is exhausted and every queued url was yielded.
+        If the caller stops iterating early, the requests that didn't start yet are dropped.
+
+        Args:
+            urls: Urls or (url, priority) tuples.
+        Yields:
+            Tuple[str, requests.Response]: The url and the server's response.
+        """
+        with self._condition:
+            self._input_done = False
+            self._input_error = None
+            self._stopped = False
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        threading.Thread(target=self._read_input, args=(urls,), name="easy_requests-scheduler-input", daemon=True).start()
+        threading.Thread(target=self._dispatch, args=(executor,), name="easy_requests-scheduler", daemon=True).start()
+
+        try:
+            while True:
+                with self._condition:
+                    while not self._results and not (self._input_done and self._outstanding == 0):
+                        self._condition.wait()
+                    if not self._results:
+                        break
+                    url, future = self._results.popleft()
+
+                try:
+                    yield url, future.result()
+                finally:
+                    # only counted as done after the caller handled it, it might add new urls meanwhile
+                    with self._condition:
+                        self._outstanding -= 1
+                        self._condition.notify_all()
+
+            if self._input_error is not None:
+                raise self._input_error
+        finally:
+            with self._condition:
+                self._stopped = True
+                self._input_done = True
+                self._queues.clear()
+                self._queued = 0
+                self._outstanding = 0
+                self._results.clear()
+                self._condition.notify_all()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _read_input(self, urls: Iterable[CrawlItem]):
+        cache = self.connection.cache.fork(**self.kwargs)
+
+        try:
+            for item in urls:
+                url, priority = (item, 0) if isinstance(item, str) else item
+
+                with self._condition:
+                    while self._queued + len(self._results) >= self.max_pending and not self._stopped:
+                        self._condition.wait()
+                    if self._stopped:
+                        return
+
+                # cached urls don't need to wait for their host
+                if cache.is_enabled and cache.has_cache(self._get_request_hash(url, cache)):
+                    self._send(url)
+                    continue
+
+                self.add(url, priority=priority)
+        except Exception as e:
+            # raised in `run` once everything read so far was yielded
+            self._input_error = e
+        finally:
+            with self._condition:
+                self._input_done = True
+                self._condition.notify_all()
+
+    def _get_request_hash(self, url: str, cache: Cache) -> str:
+        return self.connection.get_request_hash(
+            requests.Request(
+                'GET',
+                url=url,
+                headers=self.kwargs.get("headers"),
+                **(self.kwargs.get("request_kwargs") or {}),
+            ),
+            cache=cache,
+            cache_identifier=self.kwargs.get("cache_identifier", ""),
+        )
+
+    def _send(self, url: str, host: Optional[str] = None):
+        # `host` is only passed for requests that were dispatched and hold a slot of their host
+        future: Future = Future()
+        try:
+            future.set_result(self.connection.get(url, **self.kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+        with self._condition:
+            if host is not None:
+                self._in_flight[host] -= 1
+                self._running -= 1
+            if self._stopped:
+                return
+            if host is None:
+                self._outstanding += 1
+            self._results.append((url, future))
+            self._condition.notify_all()
+
+    def _next_url(self) -> Tuple[Optional[str], Optional[str], Optional[float]]:
+        """
+        Picks the url to send next among the hosts that may be requested right now, the one with the highest priority wins.
+        Returns (host, url, None), or (None, None, seconds until a host may be requested) if none may be right now.
+        Has to be called holding the condition.
+        """
+        best: Optional[Tuple[Tuple[int, int, str], str]] = None
+        min_wait: Optional[float] = None
+
+        for host, queue in list(self._queues.items()):
+            if not queue:
+                if self._in_flight.get(host, 0) == 0:
+                    del self._queues[host]
+                    self._in_flight.pop(host, None)
+                continue
+            if self._in_flight.get(host, 0) >= self.max_per_host:
+                continue
+
+            wait = self.connection.rate_limiter.get_wait(queue[0][2])
+            if wait > 0:
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+                continue
+
+            if best is None or queue[0] < best[0]:
+                best = (queue[0], host)
+
+        if best is None:
+            return None, None, min_wait
+
+        host = best[1]
+        _, _, url = heapq.heappop(self._queues[host])
+        return host, url, None
+
+    def _dispatch(self, executor: ThreadPoolExecutor):
+        with self._condition:
+            while not self._stopped:
+                if self._input_done and self._outstanding == 0:
+                    return
+
+                if self._running >= self.max_workers:
+                    self._condition.wait()
+                    continue
+
+                host, url, wait = self._next_url()
+                if url is None:
+                    # woken up early if a request finishes or a url is added
+                    self._condition.wait(timeout=wait)
+                    continue
+
+                self._queued -= 1
+                self._running += 1
+                self._in_flight[host] = self._in_flight.get(host, 0) + 1
+                self._condition.notify_all()
+                logger.debug("dispatching %s, %s urls queued", url, self._queued)
+                try:
+                    executor.submit(self._send, url, host)
+                except RuntimeError:
+                    # the executor was shut down because the caller stopped iterating
+                    return